@@ -0,0 +1,19 @@
+import os
+import tempfile
+import contextlib
+
+import parking_db
+
+
+@contextlib.contextmanager
+def scratch_database(name):
+    # Points parking_db at a new database file in a temporary directory for
+    # the duration, then back at the previous one. Configuring again also
+    # closes the pooled connections before the directory goes away.
+    previous_path = parking_db.db_path
+    with tempfile.TemporaryDirectory() as workdir:
+        parking_db.configure(os.path.join(workdir, name))
+        try:
+            yield parking_db.db_path
+        finally:
+            parking_db.configure(previous_path)
@@ -0,0 +1,126 @@
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import threading
+import statistics
+
+import parking_db
+from benchmarks import scratch_database
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def gate_operator(rng, record):
+    # Enters a car and lets an earlier one out, like a busy barrier.
+    plate = f"STR {rng.randint(1, 5000)}"
+    now = datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 60))
+    record("insert", parking_db.insert_vehicle_record, plate, now.strftime(parking_db.time_format))
+    leaving = f"STR {rng.randint(1, 5000)}"
+    later = now + datetime.timedelta(minutes=rng.randint(5, 600))
+    record("exit", parking_db.update_vehicle_record_exit_time, leaving, later.strftime(parking_db.time_format))
+
+
+def report_viewer(rng, record):
+    record("search", parking_db.search_vehicle_records, f"STR {rng.randint(1, 50)}", "prefix")
+    month = rng.randint(1, 2)
+    record("report", parking_db.get_rollup_summary, f"2024-{month:02d}-01", f"2024-{month:02d}-31")
+    record("export", lambda: sum(len(rows) for rows in parking_db.iter_vehicle_records_between(
+        f"2024-{month:02d}-01 00:00:00", f"2024-{month:02d}-01 23:59:59")))
+
+
+def run(threads, viewers, seconds, seed):
+    latencies = {}
+    errors = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def record(name, func, *args):
+        start = time.perf_counter()
+        try:
+            func(*args)
+        except Exception as e:
+            with lock:
+                errors.append(f"{name}: {e!r}")
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.setdefault(name, []).append(elapsed)
+
+    def worker(index, job):
+        rng = random.Random(seed + index)
+        while time.monotonic() < deadline:
+            job(rng, record)
+
+    workers = [threading.Thread(target=worker, args=(i, gate_operator)) for i in range(threads)]
+    workers += [threading.Thread(target=worker, args=(threads + i, report_viewer)) for i in range(viewers)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    results = {"threads": threads, "viewers": viewers, "seconds": seconds, "errors": errors[:20],
+               "error_count": len(errors), "operations": {}}
+    for name, samples in sorted(latencies.items()):
+        results["operations"][name] = {
+            "count": len(samples),
+            "per_second": len(samples) / seconds,
+            "p50_ms": statistics.median(samples) * 1000,
+            "p95_ms": _percentile(samples, 0.95) * 1000,
+            "max_ms": max(samples) * 1000,
+        }
+    return results
+
+
+def rollups_consistent():
+    # The incrementally maintained rollups must match a rebuild from scratch.
+    def snapshot():
+        with parking_db.connection() as conn:
+            return [[row for row in conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2") if any(row[skip:])]
+                    for table, skip in (("daily_rollup", 1), ("hourly_rollup", 2), ("stay_histogram", 2))]
+
+    def parked():
+        with parking_db.connection() as conn:
+            return (conn.execute("SELECT parked FROM occupancy").fetchone()[0],
+                    conn.execute("SELECT COUNT(*) FROM vehicles WHERE exit_time IS NULL").fetchone()[0])
+
+    before = snapshot()
+    counted, open_sessions = parked()
+    parking_db.rebuild_rollups()
+    return before == snapshot() and counted == open_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer the parking database from concurrent threads.")
+    parser.add_argument("--threads", type=int, default=8, help="gate operator threads (insert + exit)")
+    parser.add_argument("--viewers", type=int, default=4, help="report viewer threads (search, report, export)")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    with scratch_database("stress.db"):
+        results = run(args.threads, args.viewers, args.seconds, args.seed)
+        results["rollups_consistent"] = rollups_consistent()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, stats in results["operations"].items():
+            print(f"{name:<8} {stats['count']:7d} ops  {stats['per_second']:8.1f}/s  "
+                  f"p50 {stats['p50_ms']:7.2f} ms  p95 {stats['p95_ms']:7.2f} ms  max {stats['max_ms']:8.2f} ms")
+        print(f"errors: {results['error_count']}  rollups consistent: {results['rollups_consistent']}")
+        for error in results["errors"]:
+            print("  " + error)
+
+    if results["error_count"] or not results["rollups_consistent"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import statistics
+
+import cv2
+
+import plate_engine
+from benchmarks.preprocess import NoOcr
+from benchmarks.synthetic import random_plate, plate_image, closeup_image
+
+image_extensions = (".jpg", ".jpeg", ".png")
+
+
+def normalize(plate):
+    return ''.join(filter(str.isalnum, plate or '')).upper()
+
+
+def load_labels(folder):
+    # labels.csv (filename,plate) when present, otherwise the file name up
+    # to the first "_" is taken as the plate, e.g. "WLT1300_front.jpg".
+    labels_path = os.path.join(folder, "labels.csv")
+    if os.path.exists(labels_path):
+        with open(labels_path, newline="") as labels_file:
+            return {row[0]: row[1] for row in csv.reader(labels_file) if len(row) >= 2}
+    return {name: os.path.splitext(name)[0].split("_")[0]
+            for name in sorted(os.listdir(folder)) if name.lower().endswith(image_extensions)}
+
+
+def write_synthetic_folder(folder, count, seed, closeups=0):
+    # count car photos followed by closeups photos of just the plate.
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    with open(os.path.join(folder, "labels.csv"), "w", newline="") as labels_file:
+        writer = csv.writer(labels_file)
+        for index in range(count + closeups):
+            plate = random_plate(rng)
+            if index < count:
+                name, image = f"plate_{index:04d}.jpg", plate_image(plate, seed=seed + index)
+            else:
+                name, image = f"closeup_{index - count:04d}.jpg", closeup_image(plate, seed=seed + index)
+            with open(os.path.join(folder, name), "wb") as image_file:
+                image_file.write(image)
+            writer.writerow([name, plate])
+
+
+def largest_contour_recognize(img, reader):
+    # What process_image did before candidate ranking.
+    gray, box = plate_engine.find_plate_region(img)
+    if box is None:
+        return None
+    x, y, w, h = box
+    return plate_engine.read_plate_text(reader, gray[y:y + h, x:x + w])
+
+
+def run(folder, detectors, reader):
+    # With a NoOcr reader only detection and cropping are timed and no
+    # accuracy is reported.
+    labels = load_labels(folder)
+    results = {}
+    for name, recognize in detectors.items():
+        correct = 0
+        times = []
+        for filename, expected in labels.items():
+            img = cv2.imread(os.path.join(folder, filename), cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            start = time.perf_counter()
+            plate_number = recognize(img, reader)
+            times.append(time.perf_counter() - start)
+            correct += normalize(plate_number) == normalize(expected)
+        results[name] = {
+            "images": len(times),
+            "accuracy": correct / len(times) if times and not isinstance(reader, NoOcr) else None,
+            "ms_per_image": statistics.mean(times) * 1000 if times else None,
+            "p95_ms": sorted(times)[int(0.95 * (len(times) - 1))] * 1000 if times else None,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plate detection accuracy and speed on a folder of labelled images.")
+    parser.add_argument("folder", help="images named after their plate, or with a labels.csv (filename,plate)")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="first fill the folder with this many generated plate images")
+    parser.add_argument("--closeups", type=int, default=None,
+                        help="generated close-ups of just the plate to add (default: a quarter of --synthetic)")
+    parser.add_argument("--top-k", type=int, default=plate_engine.candidate_count)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-ocr", action="store_true",
+                        help="time detection and cropping only, without loading the OCR model")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        closeups = args.synthetic // 4 if args.closeups is None else args.closeups
+        write_synthetic_folder(args.folder, args.synthetic, args.seed, closeups)
+
+    detectors = {
+        "largest_contour": largest_contour_recognize,
+        "ranked_candidates": lambda img, reader: plate_engine.recognize_frame(img, reader, top_k=args.top_k)["plate_number"],
+    }
+    results = run(args.folder, detectors, NoOcr() if args.no_ocr else plate_engine.get_reader())
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        if not result["images"]:
+            print(f"{name:<18} no images")
+            continue
+        accuracy = f"{result['accuracy']:6.1%}" if result["accuracy"] is not None else "   n/a"
+        print(f"{name:<18} {result['images']:5d} images  accuracy {accuracy}  "
+              f"{result['ms_per_image']:8.1f} ms/image  p95 {result['p95_ms']:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
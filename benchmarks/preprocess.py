@@ -0,0 +1,85 @@
+import json
+import time
+import random
+import argparse
+import statistics
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import plate_engine
+from benchmarks.synthetic import random_plate, plate_image
+
+
+class NoOcr:
+    # Stands in for the easyocr reader so only the preprocessing is timed.
+    def readtext(self, plate_img):
+        return []
+
+
+def full_decode(data, reader):
+    # The previous path: full resolution colour decode, then grayscale.
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return plate_engine.recognize_frame(img, reader)
+
+
+def reduced_decode(data, reader):
+    return plate_engine.recognize(data, reader)
+
+
+def measure(path, images, reader):
+    # Peak is what tracemalloc sees allocated during one image: numpy arrays,
+    # including those OpenCV returns, but not OpenCV's internal buffers.
+    times, peaks = [], []
+    for data in images:
+        tracemalloc.start()
+        start = time.perf_counter()
+        path(data, reader)
+        times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        "images": len(times),
+        "ms_per_image": statistics.mean(times) * 1000,
+        "p95_ms": sorted(times)[int(0.95 * (len(times) - 1))] * 1000,
+        "peak_mb": max(peaks) / 2 ** 20,
+        "mean_peak_mb": statistics.mean(peaks) / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory and latency of image preprocessing per upload.")
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--width", type=int, default=4000, help="synthetic photo width (4000x3000 is 12 MP)")
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--ocr", action="store_true", help="include the OCR model (slower, adds its own memory)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    images = [plate_image(random_plate(rng), width=args.width, height=args.height, seed=args.seed + index)
+              for index in range(args.images)]
+    reader = plate_engine.get_reader() if args.ocr else NoOcr()
+
+    results = {
+        "width": args.width,
+        "height": args.height,
+        "decode_factor": plate_engine.reduced_decode_factor(images[0]),
+        "full_decode": measure(full_decode, images, reader),
+        "reduced_decode": measure(reduced_decode, images, reader),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.width}x{args.height} images, detection decoded at 1/{results['decode_factor']}")
+    for name in ("full_decode", "reduced_decode"):
+        result = results[name]
+        print(f"{name:<15} {result['ms_per_image']:8.1f} ms/image  p95 {result['p95_ms']:8.1f} ms  "
+              f"peak {result['peak_mb']:7.1f} MB  mean peak {result['mean_peak_mb']:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each measurement runs in a fresh interpreter so "cold" really includes the
+# imports and model load, then repeats the same work there for "warm".
+login_page_script = """
+import sys, json, time
+from streamlit.testing.v1 import AppTest
+
+app = AppTest.from_file({app!r}, default_timeout=300)
+start = time.perf_counter()
+app.run()
+cold = time.perf_counter() - start
+start = time.perf_counter()
+app.run()
+warm = time.perf_counter() - start
+print(json.dumps({{"cold": cold, "warm": warm, "ocr_loaded": "easyocr" in sys.modules}}))
+"""
+
+first_ocr_script = """
+import json, time
+import numpy as np
+import plate_engine
+from benchmarks.synthetic import plate_image
+
+image = np.frombuffer(plate_image("WLT 1300"), dtype=np.uint8)
+start = time.perf_counter()
+plate_engine.recognize(image, plate_engine.get_reader())
+cold = time.perf_counter() - start
+start = time.perf_counter()
+plate_engine.recognize(image, plate_engine.get_reader())
+warm = time.perf_counter() - start
+print(json.dumps({"cold": cold, "warm": warm}))
+"""
+
+
+def run_fresh(script, workdir):
+    env = dict(os.environ, PYTHONPATH=repo_dir + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, "-c", script], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(script, runs, workdir):
+    samples = [run_fresh(script, workdir) for _ in range(runs)]
+    summary = {"cold": statistics.median(sample["cold"] for sample in samples),
+               "warm": statistics.median(sample["warm"] for sample in samples)}
+    if "ocr_loaded" in samples[0]:
+        summary["ocr_loaded"] = any(sample["ocr_loaded"] for sample in samples)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold and warm start times of the login page and the first OCR.")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per measurement (median is reported)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    # Work in an empty directory so the app creates a throwaway database.
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {
+            "login_page": measure(login_page_script.format(app=os.path.join(repo_dir, "fyplatestdone.py")),
+                                  args.runs, workdir),
+            "first_ocr": measure(first_ocr_script, args.runs, workdir),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        print(f"{name:<12} cold {result['cold'] * 1000:9.1f} ms   warm {result['warm'] * 1000:9.1f} ms")
+    if results["login_page"]["ocr_loaded"]:
+        print("warning: the login page imported easyocr")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import datetime
+import platform
+import subprocess
+import statistics
+
+import parking_db
+import plate_match
+from benchmarks import scratch_database
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Everything is generated from the seed, so two runs with the same options
+# do the same work and their JSON results can be compared across commits.
+# The synthetic table spans one year; about one stay in twenty is still open.
+table_year = 2024
+report_month = "2024-06"
+open_fraction = 0.05
+
+
+def _timed(samples, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def _summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "per_second": len(ordered) / sum(ordered) if sum(ordered) else None,
+        "mean_ms": statistics.mean(ordered) * 1000,
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def _table_plate(rng):
+    # Same shape as benchmarks.synthetic.random_plate, without needing OpenCV.
+    letters = ''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(1, 3)))
+    return f"{letters} {rng.randint(1, 9999)}"
+
+
+def _table_rows(count, rng):
+    start = datetime.datetime(table_year, 1, 1)
+    span = 365 * 24 * 3600
+    for _ in range(count):
+        entry = start + datetime.timedelta(seconds=rng.randrange(span))
+        exit = None
+        if rng.random() >= open_fraction:
+            exit = (entry + datetime.timedelta(minutes=rng.randint(5, 600))).strftime(parking_db.time_format)
+        plate = _table_plate(rng)
+        yield plate, plate_match.plate_key(plate), entry.strftime(parking_db.time_format), exit
+
+
+def populate(rows, rng, chunk_size=50000):
+    # Bulk load straight into vehicles, then build the rollups once.
+    remaining = rows
+    generated = _table_rows(rows, rng)
+    while remaining:
+        chunk = [next(generated) for _ in range(min(chunk_size, remaining))]
+        with parking_db.transaction() as conn:
+            conn.executemany("INSERT INTO vehicles (plate_number, plate_key, entry_time, exit_time) "
+                             "VALUES (?, ?, ?, ?)", chunk)
+        remaining -= len(chunk)
+    parking_db.rebuild_rollups()
+
+
+def bench_ocr(images, seed):
+    # process_image throughput on distinct images, so every call is a cache
+    # miss; the result cache is kept in memory only for the run.
+    import numpy as np
+    import plate_cache
+    import plate_engine
+    from benchmarks.synthetic import plate_image, random_plate
+
+    plate_cache.cache_path = None
+    rng = random.Random(seed)
+    samples = [np.frombuffer(plate_image(random_plate(rng), seed=seed + index), dtype=np.uint8)
+               for index in range(images + 1)]
+    reader = plate_engine.get_reader()
+    plate_engine.process_image(samples[0], reader)
+
+    times = []
+    for image in samples[1:]:
+        _timed(times, plate_engine.process_image, image, reader)
+    return {"ocr.process_image": _summarize(times)}
+
+
+def bench_database(operations, rng):
+    results = {}
+    month_start = f"{report_month}-01 00:00:00"
+
+    # Gate traffic: a new entry, then the exit of that same plate.
+    inserts, exits = [], []
+    for index in range(operations):
+        plate = f"BEN {index}"
+        now = datetime.datetime(table_year + 1, 1, 1) + datetime.timedelta(minutes=index)
+        _timed(inserts, parking_db.insert_vehicle_record, plate, now.strftime(parking_db.time_format))
+        later = now + datetime.timedelta(minutes=30)
+        _timed(exits, parking_db.update_vehicle_record_exit_time, plate, later.strftime(parking_db.time_format))
+    results["db.insert"] = _summarize(inserts)
+    results["db.exit"] = _summarize(exits)
+
+    # The View Records filters: first page of each. The broad ones fill the
+    # page at once whatever the plan; the selective and empty ones only stay
+    # fast when the search walks an index, and catch it if it scans instead.
+    empty_day = f"{table_year + 2}-01-01"
+    searches = {
+        "db.search_prefix": lambda: parking_db.search_vehicle_records(rng.choice(string.ascii_uppercase), "prefix"),
+        "db.search_prefix_selective": lambda: parking_db.search_vehicle_records(
+            f"{_table_plate(rng).split()[0]} {rng.randint(1, 9)}", "prefix"),
+        # Table plates never have a digit straight after a letter.
+        "db.search_prefix_no_match": lambda: parking_db.search_vehicle_records(
+            f"{rng.choice(string.ascii_uppercase)}{rng.randint(0, 9)}", "prefix"),
+        "db.search_substring": lambda: parking_db.search_vehicle_records(str(rng.randint(10, 99)), "substring"),
+        "db.search_time_range": lambda: parking_db.search_vehicle_records(
+            time_from=month_start, time_to=f"{report_month}-07 23:59:59"),
+        "db.search_time_range_empty": lambda: parking_db.search_vehicle_records(
+            time_from=f"{empty_day} 00:00:00", time_to=f"{empty_day} 23:59:59"),
+    }
+    # View Records itself goes through record_frames, which adds the pandas
+    # frame and duration columns on top of the same statement.
+    from record_frames import search_records_frame
+    searches["frame.search_prefix"] = lambda: search_records_frame(rng.choice(string.ascii_uppercase), "prefix")
+    searches["frame.search_substring"] = lambda: search_records_frame(str(rng.randint(10, 99)), "substring")
+    for name, search in searches.items():
+        samples = []
+        for _ in range(operations):
+            _timed(samples, search)
+        results[name] = _summarize(samples)
+
+    with parking_db.connection() as conn:
+        max_id = conn.execute("SELECT MAX(id) FROM vehicles").fetchone()[0] or 0
+    deletes = []
+    for record_id in rng.sample(range(1, max_id + 1), min(operations, max_id)):
+        _timed(deletes, parking_db.delete_vehicle_record, record_id)
+    results["db.delete"] = _summarize(deletes)
+    return results
+
+
+def bench_monthly_report(repeats):
+    from report_export import export_vehicle_records
+
+    year, month = map(int, report_month.split("-"))
+    last_day = (datetime.date(year, month, 1) + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+    summaries, exports = [], []
+    for _ in range(repeats):
+        _timed(summaries, parking_db.get_rollup_summary, f"{report_month}-01", last_day.strftime("%Y-%m-%d"))
+        path = _timed(exports, export_vehicle_records, f"{report_month}-01 00:00:00",
+                      last_day.strftime("%Y-%m-%d 23:59:59"), "CSV", "Monthly_Report.csv")
+        os.remove(path)
+    return {"report.monthly_summary": _summarize(summaries), "report.monthly_export_csv": _summarize(exports)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(rows, operations, images, report_repeats, seed):
+    rng = random.Random(seed)
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "rows": rows,
+        "operations": operations,
+        "seed": seed,
+        "benchmarks": {},
+    }
+
+    with scratch_database("bench.db"):
+        start = time.perf_counter()
+        populate(rows, rng)
+        results["populate_seconds"] = time.perf_counter() - start
+        results["benchmarks"].update(bench_database(operations, rng))
+        results["benchmarks"].update(bench_monthly_report(report_repeats))
+
+    if images:
+        results["benchmarks"].update(bench_ocr(images, seed))
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Benchmarks whose p50 grew by more than threshold (a fraction) since
+    # the baseline run.
+    regressions = []
+    for name, stats in results["benchmarks"].items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if not before or not before["p50_ms"]:
+            continue
+        change = stats["p50_ms"] / before["p50_ms"] - 1
+        if change > threshold:
+            regressions.append((name, before["p50_ms"], stats["p50_ms"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the OCR and database paths on synthetic data.")
+    parser.add_argument("--rows", type=int, default=100000, help="rows in the synthetic vehicles table")
+    parser.add_argument("--operations", type=int, default=200, help="timed calls per database benchmark")
+    parser.add_argument("--images", type=int, default=20, help="synthetic images for process_image (0 skips OCR)")
+    parser.add_argument("--report-repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="p50 slowdown counted as a regression (default: %(default)s = 20%%)")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.operations, args.images, args.report_repeats, args.seed)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    print(f"commit {results['commit']}  rows {results['rows']}  populate {results['populate_seconds']:.1f} s")
+    for name, stats in results["benchmarks"].items():
+        print(f"{name:<26} {stats['count']:6d} calls  p50 {stats['p50_ms']:9.3f} ms  "
+              f"p95 {stats['p95_ms']:9.3f} ms  max {stats['max_ms']:9.3f} ms")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: p50 {before:.3f} ms -> {after:.3f} ms (+{change:.0%}) "
+                  f"since {baseline.get('commit')}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions over {args.threshold:.0%} against {baseline.get('commit')}.")
+
+
+if __name__ == "__main__":
+    main()
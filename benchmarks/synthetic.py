@@ -0,0 +1,55 @@
+import random
+import string
+
+import cv2
+import numpy as np
+
+
+def random_plate(rng=random):
+    # Malaysian style: 1-3 letters, 1-4 digits, e.g. "WLT 1300".
+    letters = ''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(1, 3)))
+    digits = str(rng.randint(1, 9999))
+    return f"{letters} {digits}"
+
+
+def plate_image(text, width=1280, height=960, seed=0, extension=".jpg"):
+    # A light car body on a noisy background with a black plate and white
+    # characters, encoded the way an upload would be.
+    rng = np.random.default_rng(seed)
+    img = rng.integers(90, 160, size=(height, width, 3), dtype=np.uint8)
+    cv2.rectangle(img, (width // 8, height // 4), (width * 7 // 8, height * 7 // 8), (205, 205, 200), -1)
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    scale = width / 640
+    thickness = max(2, int(scale * 3))
+    (text_w, text_h), baseline = cv2.getTextSize(text, font, scale, thickness)
+    x = (width - text_w) // 2
+    y = height * 2 // 3
+    margin = text_h // 2
+    cv2.rectangle(img, (x - margin, y - text_h - margin), (x + text_w + margin, y + baseline + margin), (15, 15, 15), -1)
+    cv2.putText(img, text, (x, y), font, scale, (245, 245, 245), thickness, cv2.LINE_AA)
+
+    return _encode(img, extension)
+
+
+def closeup_image(text, width=500, height=150, seed=0, extension=".jpg"):
+    # A close-up photo of just the plate: black with white characters
+    # filling the frame, so there is no outline around the plate to find.
+    rng = np.random.default_rng(seed)
+    img = rng.integers(5, 30, size=(height, width, 3), dtype=np.uint8)
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    thickness = max(2, height // 40)
+    (text_w, text_h), baseline = cv2.getTextSize(text, font, 1.0, thickness)
+    scale = min(width * 0.85 / text_w, height * 0.6 / text_h)
+    (text_w, text_h), baseline = cv2.getTextSize(text, font, scale, thickness)
+    cv2.putText(img, text, ((width - text_w) // 2, (height + text_h) // 2), font, scale,
+                (245, 245, 245), thickness, cv2.LINE_AA)
+    return _encode(img, extension)
+
+
+def _encode(img, extension):
+    ok, encoded = cv2.imencode(extension, img)
+    if not ok:
+        raise RuntimeError(f"Could not encode synthetic image as {extension}")
+    return encoded.tobytes()
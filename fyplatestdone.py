@@ -1,43 +1,28 @@
-import easyocr
-import cv2
-import numpy as np
 import datetime
-import sqlite3
 import streamlit as st
 import re
 import pandas as pd
 import hashlib
-import base64
-
-languages = ['en']
-
-reader = easyocr.Reader(languages, gpu=False) 
-
-conn = sqlite3.connect('stationnement_database.db')
-c = conn.cursor()
-
-c.execute('''CREATE TABLE IF NOT EXISTS users
-             (username TEXT PRIMARY KEY, password TEXT)''')
-
-c.execute('''CREATE TABLE IF NOT EXISTS vehicles
-             (id INTEGER PRIMARY KEY AUTOINCREMENT,
-             plate_number TEXT,
-             entry_time DATETIME,
-             exit_time DATETIME)''')
+import os
+import plate_engine
+import ocr_jobs
+import gate_service
+import metrics
+import record_frames
+from parking_db import (get_user, add_user, is_admin, delete_vehicle_record, write_generation,
+                        get_vehicle_record, update_vehicle_record,
+                        calculate_duration, parse_time)
+from report_export import export_formats, export_vehicle_records
 
 def create_user(username, password):
     hashed_password = make_hashes(password)
-    c.execute("INSERT INTO users (username, password) VALUES (?, ?)",
-              (username, hashed_password))
-    conn.commit()
+    add_user(username, hashed_password)
 
 def user_exists(username):
-    c.execute("SELECT * FROM users WHERE username=?", (username,))
-    return c.fetchone() is not None
+    return get_user(username) is not None
 
 def validate_user(username, password):
-    c.execute("SELECT * FROM users WHERE username=?", (username,))
-    user = c.fetchone()
+    user = get_user(username)
     if user:
         hashed_password = user[1]
         return check_hashes(password, hashed_password)
@@ -45,6 +30,7 @@ def validate_user(username, password):
 
 def logout_user():
     st.session_state.login = False
+    st.session_state.pop("username", None)
 
 def make_hashes(password):
     return hashlib.sha256(str.encode(password)).hexdigest()
@@ -68,6 +54,7 @@ def login_interface():
     if login_clicked:
         if validate_user(username, password):
             session_state.login = True
+            session_state.username = username
         else:
             st.warning("Invalid username or password!")
 
@@ -105,151 +92,124 @@ def is_strong_password(password):
         return False
     return True
 
+def uploaded_file_key(uploaded_file):
+    return getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+
+def submit_new_uploads(uploaded_files, direction):
+    # Streamlit reruns the page on every interaction while the files are still
+    # in the uploader. Files that already have a job were handed over on an
+    # earlier run, so only the new ones are queued. Returns the job ids of
+    # every file currently in the uploader.
+    jobs = st.session_state.setdefault(f"{direction}_jobs", {})
+    for uploaded_file in uploaded_files:
+        key = uploaded_file_key(uploaded_file)
+        if key not in jobs:
+            jobs[key] = ocr_jobs.submit(uploaded_file.getbuffer(), direction, uploaded_file.name)
+    return [jobs[uploaded_file_key(uploaded_file)] for uploaded_file in uploaded_files]
+
+def show_jobs(job_ids):
+    pending = 0
+    for job in ocr_jobs.get_jobs(job_ids):
+        if job["status"] in ("queued", "running"):
+            pending += 1
+            st.info(f"{job['name']}: recognizing plate ({job['status']})...")
+        for kind, message in job["messages"]:
+            getattr(st, kind)(message)
+    stats = plate_engine.cache_stats()
+    st.caption(f"Plate recognition cache: {stats['hits']} hits, {stats['misses']} misses")
+    if pending and not hasattr(st, "fragment"):
+        st.button("Refresh Status")
+
+# Recognition runs in the background; where Streamlit supports fragments the
+# job list polls itself without rerunning the rest of the page.
+if hasattr(st, "fragment"):
+    show_jobs = st.fragment(run_every=2)(show_jobs)
+
 def display_entry_form():
     st.header("Vehicle Entry")
     uploaded_files = st.file_uploader("Upload Images", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
     if uploaded_files:
-        for uploaded_file in uploaded_files:
-            image = np.array(bytearray(uploaded_file.read()), dtype=np.uint8)
-            plate_number = process_image(image)
-            if plate_number:
-                entry_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                insert_vehicle_record(plate_number, entry_time)
-                st.success(f"Vehicle with plate number {plate_number} recorded at {entry_time}")
-            else:
-                st.warning("No license plate detected in one or more uploaded images.")
-
-def process_image(image):
-    img = cv2.imdecode(image, cv2.IMREAD_COLOR)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    blur = cv2.GaussianBlur(gray, (5, 5), 0)
-    _, thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    thresh = cv2.bitwise_not(thresh)
-    kernel = np.ones((3, 3), np.uint8)
-    masked = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-
-    contours, _ = cv2.findContours(masked, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    min_contour_area = 500
-    largest_area = 0
-    largest_contour = None
-
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if area > min_contour_area and area > largest_area:
-            largest_area = area
-            largest_contour = contour
-
-    if largest_contour is not None:
-        x, y, w, h = cv2.boundingRect(largest_contour)
-        plate_img = gray[y:y + h, x:x + w]
-
-        result = reader.readtext(plate_img)
-
-        alphanumeric_text = ''
-        for detection in result:
-            text = detection[1]
-            alphanumeric_text += ''.join(filter(str.isalnum, text)) + ' '
-
-        return alphanumeric_text.strip()
-    else:
-        return None
+        show_jobs(submit_new_uploads(uploaded_files, "entry"))
 
 def display_exit_form():
     st.header("Vehicle Exit")
     uploaded_files = st.file_uploader("Upload Images", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
     if uploaded_files:
-        for uploaded_file in uploaded_files:
-            image = np.array(bytearray(uploaded_file.read()), dtype=np.uint8)
-            plate_number = process_image(image)
-            if plate_number:
-                exit_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                update_vehicle_record_exit_time(plate_number, exit_time)
-                st.success(f"Vehicle with plate number {plate_number} exited at {exit_time}")
-                record = get_vehicle_record_by_plate(plate_number)
-                if record:
-                    entry_time = datetime.datetime.strptime(record[2], "%Y-%m-%d %H:%M:%S")
-                    duration = calculate_duration(entry_time, datetime.datetime.strptime(exit_time, "%Y-%m-%d %H:%M:%S"))
-                    st.info(f"Duration of Stay: {duration}")
-            else:
-                st.warning("No license plate detected in one or more uploaded images.")
-
-def get_vehicle_record_by_plate(plate_number):
-    c.execute("SELECT * FROM vehicles WHERE plate_number = ? ORDER BY entry_time DESC",
-              (plate_number,))
-    return c.fetchone()
-
-def update_vehicle_record_exit_time(plate_number, exit_time):
-    c.execute("UPDATE vehicles SET exit_time = ? WHERE plate_number = ? AND exit_time IS NULL",
-              (exit_time, plate_number))
-    conn.commit()
-
-def get_latest_id():
-    c.execute("SELECT MAX(id) FROM vehicles")
-    result = c.fetchone()
-    return result[0] if result[0] else 0
-
-def insert_vehicle_record(plate_number, entry_time):
-    latest_id = get_latest_id()
-    new_id = latest_id + 1
-
-    c.execute("INSERT INTO vehicles (id, plate_number, entry_time) VALUES (?, ?, ?)",
-              (new_id, plate_number, entry_time))
-    conn.commit()
-
-    # Update the IDs of remaining records in the database
-    c.execute("SELECT id FROM vehicles WHERE id > ? ORDER BY id ASC", (new_id,))
-    records_to_update = c.fetchall()
-    for record in records_to_update:
-        c.execute("UPDATE vehicles SET id=? WHERE id=?", (new_id, record[0]))
-        new_id += 1
-    conn.commit()
-
-def calculate_duration(entry_time, exit_time):
-    duration = exit_time - entry_time
-    days, seconds = duration.days, duration.seconds
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    duration_string = f"{days} days, {hours} hours, {minutes} minutes"
-    return duration_string
+        show_jobs(submit_new_uploads(uploaded_files, "exit"))
+
+# Query results are cached per set of query parameters and per database
+# write generation, so reruns of an unchanged page do not go back to the
+# database, and any write made through this app invalidates them at once.
+# Writes by other processes (gate service, tools) show up after the ttl.
+@st.cache_data(ttl=30, show_spinner=False)
+def load_records_page(plate, plate_match, time_from, time_to, after, limit, generation):
+    return record_frames.search_records_frame(plate, plate_match, time_from, time_to, after, limit)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_report_summary(first_day, last_day, generation):
+    return gate_service.report_summary(first_day, last_day)
 
 def display_records_table():
     st.header("Vehicle Records")
-    # Sort records in ascending order by ID
-    c.execute("SELECT * FROM vehicles ORDER BY id ASC")  
-    records = c.fetchall()
 
     # Add search widgets
     search_plate = st.text_input("Search by Plate Number")
-    search_time = st.text_input("Search by Entry/Exit Time (YYYY-MM-DD HH:MM:SS)")
-
-    if records:
-        # Filter records based on search criteria
-        filtered_records = []
-        for record in records:
-            entry_time = datetime.datetime.strptime(record[2], "%Y-%m-%d %H:%M:%S")
-            exit_time = datetime.datetime.strptime(record[3], "%Y-%m-%d %H:%M:%S") if record[3] else None
-
-            # Filter by plate number
-            if search_plate and search_plate.lower() not in record[1].lower():
-                continue
-
-            # Filter by entry/exit time
-            if search_time:
-                search_time_dt = datetime.datetime.strptime(search_time, "%Y-%m-%d %H:%M:%S")
-                if search_time_dt > entry_time or (exit_time and search_time_dt > exit_time):
-                    continue
-
-            duration = calculate_duration(entry_time, exit_time) if exit_time else "N/A"
-            filtered_records.append({"ID": record[0], "Plate Number": record[1], "Entry Time": entry_time, "Exit Time": exit_time, "Duration": duration})
-
-        if filtered_records:
-            st.write("Total Records:", len(filtered_records))
-            st.table(pd.DataFrame(filtered_records))
-        else:
-            st.warning("No matching records found.")
+    plate_match = st.radio("Plate Number Match", ("Starts with", "Contains"), horizontal=True)
+    search_from = st.text_input("Entry Time From (YYYY-MM-DD HH:MM:SS)")
+    search_to = st.text_input("Entry Time To (YYYY-MM-DD HH:MM:SS)")
+    page_size = st.selectbox("Records per Page", (25, 50, 100), index=1)
+
+    for search_time in (search_from, search_to):
+        if search_time:
+            try:
+                datetime.datetime.strptime(search_time, "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                st.warning("Please enter times as YYYY-MM-DD HH:MM:SS.")
+                return
+
+    # Remember the last record of every page visited so far; each page is
+    # then fetched as the records after it instead of skipping over earlier
+    # rows. Start over from the first page whenever the search changes.
+    search_key = (search_plate, plate_match, search_from, search_to, page_size)
+    if st.session_state.get("records_search") != search_key:
+        st.session_state.records_search = search_key
+        st.session_state.records_pages = [None]
+    pages = st.session_state.records_pages
+
+    # Listed by entry time for a time range, by plate for a prefix and by ID
+    # otherwise (see parking_db.search_order), one extra row to know if
+    # there is a next page
+    records = load_records_page(search_plate.strip(), "prefix" if plate_match == "Starts with" else "substring",
+                                search_from, search_to, pages[-1], page_size + 1, write_generation())
+    has_next_page = len(records) > page_size
+    records = records.iloc[:page_size]
+
+    if not records.empty:
+        first_number = (len(pages) - 1) * page_size + 1
+        # "No." is only the position in this listing; "ID" is the stable
+        # record id used by the edit and delete pages.
+        table_data = pd.DataFrame({"No.": range(first_number, first_number + len(records)),
+                                   "ID": records["id"].to_numpy(),
+                                   "Plate Number": records["plate_number"].to_numpy(),
+                                   "Entry Time": records["entry_time"].to_numpy(),
+                                   "Exit Time": records["exit_time"].to_numpy(),
+                                   "Duration": records["duration"].to_numpy()})
+
+        st.write(f"Page {len(pages)}: records {first_number} to {first_number + len(records) - 1}")
+        st.table(table_data)
+    elif search_plate or search_from or search_to:
+        st.warning("No matching records found.")
     else:
         st.warning("No records found.")
 
+    previous_column, next_column = st.columns(2)
+    if previous_column.button("Previous Page", disabled=len(pages) == 1):
+        pages.pop()
+        st.rerun()
+    if next_column.button("Next Page", disabled=not has_next_page):
+        pages.append(record_frames.page_cursor(records))
+        st.rerun()
+
 def edit_record():
     st.header("Edit/Modify Records")
 
@@ -266,8 +226,7 @@ def edit_record():
                 raise ValueError("Invalid record ID. Please enter a valid numeric ID.")
             elif record_id:
                 record_id = int(record_id)
-                c.execute("SELECT * FROM vehicles WHERE id=?", (record_id,))
-                record_to_edit = c.fetchone()
+                record_to_edit = get_vehicle_record(record_id)
 
                 if not record_to_edit:
                     st.warning("No record found with the given ID.")
@@ -292,9 +251,7 @@ def edit_record():
             if st.form_submit_button("Update Record"):
                 try:
                     # Update the record with the new data
-                    c.execute("UPDATE vehicles SET plate_number=?, entry_time=?, exit_time=? WHERE id=?",
-                              (plate_number, entry_time, exit_time, record_id))
-                    conn.commit()
+                    update_vehicle_record(record_id, plate_number, entry_time, exit_time)
                     st.success("Record updated successfully.")
                 except Exception as e:
                     st.error(f"An error occurred while updating the record: {str(e)}")
@@ -310,8 +267,7 @@ def delete_record():
 
     if st.button("Show Record"):
         # Fetch the record with the given record ID
-        c.execute("SELECT * FROM vehicles WHERE id=?", (record_id,))
-        record = c.fetchone()
+        record = get_vehicle_record(record_id)
 
         # Check if the record with the given ID exists
         if not record:
@@ -338,20 +294,10 @@ def delete_record():
         if record_id is not None:
             try:
                 # Delete the record with the given record ID
-                c.execute("DELETE FROM vehicles WHERE id=?", (int(record_id),))
-                conn.commit()
-
-                # Update the record IDs
-                c.execute("SELECT id FROM vehicles ORDER BY id ASC")
-                updated_ids = c.fetchall()
-                for i, record in enumerate(updated_ids, start=1):
-                    new_id = i
-                    old_id = record[0]
-                    if new_id != old_id:
-                        c.execute("UPDATE vehicles SET id=? WHERE id=?", (new_id, old_id))
-                        conn.commit()
-
-                st.success("Record deleted successfully.")
+                if delete_vehicle_record(int(record_id)):
+                    st.success("Record deleted successfully.")
+                else:
+                    st.warning("No record found with the given ID.")
 
             except Exception as e:
                 st.error(f"An error occurred while deleting the record: {str(e)}")
@@ -369,39 +315,56 @@ def generate_report():
     elif report_type == "Monthly Report":
         generate_monthly_report()
 
+def format_stay(seconds):
+    if seconds is None:
+        return "N/A"
+    start = datetime.datetime(2000, 1, 1)
+    return calculate_duration(start, start + datetime.timedelta(seconds=seconds))
+
+def display_report_summary(summary):
+    st.write("Total Vehicles Entered:", summary["entries"])
+    st.write("Total Vehicles Exited:", summary["exits"])
+    st.write("Average Duration of Stay:", format_stay(summary["average_stay_seconds"]))
+    st.write("Median Duration of Stay (approx.):", format_stay(summary["median_stay_seconds"]))
+    st.write("90% of Stays Shorter Than (approx.):", format_stay(summary["p90_stay_seconds"]))
+    if summary["hourly"]:
+        st.write("Occupancy by Hour")
+        st.line_chart(pd.DataFrame(summary["hourly"]).set_index("hour")["occupancy"])
+
+def offer_download(start_time, end_time, report_name):
+    # The summary above comes from the rollup tables; the individual records
+    # are only read when an export is asked for, and then streamed from the
+    # database into a file chunk by chunk rather than built up in memory.
+    file_format = st.selectbox("Export Format", tuple(export_formats))
+    exports = st.session_state.setdefault("report_exports", {})
+    filename = f"{report_name}.{export_formats[file_format]['extension']}"
+
+    if st.button("Prepare Download"):
+        try:
+            exports[filename] = export_vehicle_records(start_time, end_time, file_format, filename)
+        except RuntimeError as e:
+            st.error(str(e))
+            return
+
+    path = exports.get(filename)
+    if path and os.path.exists(path):
+        with open(path, "rb") as export_file:
+            st.download_button(f"Download {filename}", export_file, file_name=filename,
+                               mime=export_formats[file_format]["mime"])
+
 def generate_daily_report():
     st.subheader("Daily Report Generator")
     selected_date = st.date_input("Select Date", datetime.datetime.today())
     st.info(f"Generating Daily Report for {selected_date}")
 
-    # Fetch data from the SQLite database based on selected_date and generate the report.
-    c.execute("SELECT * FROM vehicles WHERE entry_time BETWEEN ? AND ? ORDER BY entry_time ASC",
-              (selected_date.strftime("%Y-%m-%d 00:00:00"), selected_date.strftime("%Y-%m-%d 23:59:59")))
-    records = c.fetchall()
-
-    if records:
-        st.write("Total Vehicles Entered:", len(records))
-        table_data = []
-        for record in records:
-            entry_time = datetime.datetime.strptime(record[2], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
-            exit_time = datetime.datetime.strptime(record[3], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S") if record[3] else "N/A"
-            duration = calculate_duration(datetime.datetime.strptime(record[2], "%Y-%m-%d %H:%M:%S"),
-                                          datetime.datetime.strptime(record[3], "%Y-%m-%d %H:%M:%S") if record[3] else datetime.datetime.now())
-            table_data.append([record[0], record[1], entry_time, exit_time, duration])
-
-        # Create a DataFrame from the table_data list
-        df = pd.DataFrame(table_data, columns=["ID", "Plate Number", "Entry Time", "Exit Time", "Duration"])
-
-        # Save the DataFrame to a CSV file
-        csv_file = df.to_csv(index=False)
-        b64 = base64.b64encode(csv_file.encode()).decode()
-        filename = f"Daily_Report_{selected_date.strftime('%Y-%m-%d')}.csv"
-        href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">Download {filename}</a>'
-        st.markdown(href, unsafe_allow_html=True)
-
-        # Display the report in a table
-        # st.table(df)
+    # Read the day's figures from the rollup tables.
+    day = selected_date.strftime("%Y-%m-%d")
+    summary = load_report_summary(day, day, write_generation())
 
+    if summary["entries"]:
+        display_report_summary(summary)
+        offer_download(selected_date.strftime("%Y-%m-%d 00:00:00"), selected_date.strftime("%Y-%m-%d 23:59:59"),
+                       f"Daily_Report_{selected_date.strftime('%Y-%m-%d')}")
     else:
         st.warning("No records found for the selected date.")
 
@@ -410,39 +373,81 @@ def generate_monthly_report():
     selected_month = st.date_input("Select Month", datetime.datetime.today().replace(day=1))
     st.info(f"Generating Monthly Report for {selected_month}")
 
-    # Fetch data from the SQLite database based on selected_month and generate the report.
+    # Read the month's figures from the rollup tables: one row per day.
     first_day = selected_month.replace(day=1)
     last_day = (first_day + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
-    c.execute("SELECT * FROM vehicles WHERE entry_time BETWEEN ? AND ? ORDER BY entry_time ASC",
-              (first_day.strftime("%Y-%m-%d 00:00:00"), last_day.strftime("%Y-%m-%d 23:59:59")))
-    records = c.fetchall()
-
-    if records:
-        st.write("Total Vehicles Entered:", len(records))
-        table_data = []
-        for record in records:
-            entry_time = datetime.datetime.strptime(record[2], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
-            exit_time = datetime.datetime.strptime(record[3], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S") if record[3] else "N/A"
-            duration = calculate_duration(datetime.datetime.strptime(record[2], "%Y-%m-%d %H:%M:%S"),
-                                          datetime.datetime.strptime(record[3], "%Y-%m-%d %H:%M:%S") if record[3] else datetime.datetime.now())
-            table_data.append([record[0], record[1], entry_time, exit_time, duration])
-
-        # Create a DataFrame from the table_data list
-        df = pd.DataFrame(table_data, columns=["ID", "Plate Number", "Entry Time", "Exit Time", "Duration"])
-
-        # Save the DataFrame to a CSV file
-        csv_file = df.to_csv(index=False)
-        b64 = base64.b64encode(csv_file.encode()).decode()
-        filename = f"Monthly_Report_{selected_month.strftime('%Y-%m')}.csv"
-        href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">Download {filename}</a>'
-        st.markdown(href, unsafe_allow_html=True)
-
-        # Display the report in a table
-        # st.table(df)
-
+    summary = load_report_summary(first_day.strftime("%Y-%m-%d"), last_day.strftime("%Y-%m-%d"), write_generation())
+
+    if summary["entries"]:
+        display_report_summary(summary)
+        st.write("Daily Breakdown")
+        st.table(pd.DataFrame([{"Date": day["day"], "Vehicles Entered": day["entries"], "Vehicles Exited": day["exits"],
+                                "Average Duration of Stay": format_stay(day["average_stay_seconds"])}
+                               for day in summary["days"]]))
+        offer_download(first_day.strftime("%Y-%m-%d 00:00:00"), last_day.strftime("%Y-%m-%d 23:59:59"),
+                       f"Monthly_Report_{selected_month.strftime('%Y-%m')}")
     else:
         st.warning("No records found for the selected month.")
 
+def show_occupancy():
+    occupancy = gate_service.occupancy()
+    now = datetime.datetime.now()
+    parked, entered, exited = st.columns(3)
+    parked.metric("Currently Parked", occupancy["parked"])
+    entered.metric("Entered Today", occupancy["entries"])
+    exited.metric("Exited Today", occupancy["exits"])
+
+    if occupancy["hourly"]:
+        st.write("Today by Hour")
+        st.bar_chart(pd.DataFrame([{"Hour": f"{hour['hour']:02d}:00", "Entries": hour["entries"],
+                                    "Exits": hour["exits"]} for hour in occupancy["hourly"]]).set_index("Hour"))
+
+    if occupancy["longest"]:
+        st.write("Longest Staying Vehicles")
+        rows = []
+        for vehicle in occupancy["longest"]:
+            entry_time = parse_time(vehicle["entry_time"])
+            rows.append({"ID": vehicle["id"], "Plate Number": vehicle["plate_number"],
+                         "Entry Time": vehicle["entry_time"],
+                         "Parked For": calculate_duration(entry_time, now) if entry_time else "N/A"})
+        st.table(pd.DataFrame(rows))
+    st.caption(f"Updated {now.strftime('%H:%M:%S')}; last gate change at {occupancy['updated_at']}")
+    if not hasattr(st, "fragment"):
+        st.button("Refresh")
+
+# Only this part of the page reruns on the timer.
+if hasattr(st, "fragment"):
+    show_occupancy = st.fragment(run_every=5)(show_occupancy)
+
+def display_dashboard():
+    st.header("Dashboard")
+    show_occupancy()
+
+def display_performance():
+    # Admin only: where the time goes in recognition and database calls,
+    # as measured in this Streamlit server process.
+    st.header("Performance")
+    window_minutes = st.selectbox("Window", (5, 15, 60), index=1, format_func=lambda minutes: f"Last {minutes} minutes")
+    rows = metrics.summary(window_minutes * 60)
+    if rows:
+        st.dataframe(pd.DataFrame([{"Stage": row["stage"], "Calls": row["count"],
+                                    "p50 (ms)": round(row["p50"] * 1000, 1),
+                                    "p95 (ms)": round(row["p95"] * 1000, 1),
+                                    "p99 (ms)": round(row["p99"] * 1000, 1),
+                                    "Max (ms)": round(row["max"] * 1000, 1)} for row in rows]),
+                     hide_index=True)
+    else:
+        st.info("Nothing has been measured in this window yet.")
+
+    counts = metrics.counters()
+    if counts:
+        st.write("Counters")
+        st.table(pd.DataFrame(sorted(counts.items()), columns=["Counter", "Total"]))
+    st.write("OCR jobs waiting:", ocr_jobs.pending_count())
+    with st.expander("Prometheus export"):
+        st.code(metrics.prometheus_text(), language="text")
+    st.button("Refresh")
+
 # Authentication interface
 def authentication():
     global session_state
@@ -466,8 +471,11 @@ if __name__ == "__main__":
     
     if session_state.login:
         st.sidebar.subheader("Options")
-        option = st.sidebar.selectbox("Select an option",
-                                      ("Record Entry", "Record Exit", "View Records", "Edit/Modify Records", "Delete Records", "Generate Report"))
+        options = ("Record Entry", "Record Exit", "View Records", "Edit/Modify Records", "Delete Records",
+                   "Generate Report", "Dashboard")
+        if is_admin(session_state.get("username")):
+            options += ("Performance",)
+        option = st.sidebar.selectbox("Select an option", options)
         if option == "Record Entry":
             display_entry_form()
         elif option == "Record Exit":
@@ -480,6 +488,10 @@ if __name__ == "__main__":
             delete_record()
         elif option == "Generate Report":
             generate_report()
+        elif option == "Dashboard":
+            display_dashboard()
+        elif option == "Performance":
+            display_performance()
 
 
 st.sidebar.markdown("---")
@@ -0,0 +1,216 @@
+import os
+import json
+import hmac
+import argparse
+import datetime
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import metrics
+import plate_engine
+from parking_db import (insert_vehicle_record, close_open_session, get_rollup_summary, get_occupancy,
+                        calculate_duration, parse_time, time_format)
+
+# The gate logic without any UI: read a plate from an image and open or
+# close its parking session. The Streamlit app, gate_stream.py and the HTTP
+# server below all go through these functions. Barrier controllers POST the
+# raw image bytes to /entry or /exit and get the session back as JSON; the
+# connection is kept alive between requests and the OCR model stays loaded.
+default_host = "127.0.0.1"
+default_port = 8600
+max_upload_bytes = 20 * 1024 * 1024
+
+# When set, requests must carry it as "Authorization: Bearer <token>".
+api_token = os.environ.get("GATE_API_TOKEN")
+
+
+def now():
+    return datetime.datetime.now().strftime(time_format)
+
+
+def record_plate(plate_number, direction, recorded_at=None):
+    # Opens (entry) or closes (exit) the plate's session. Returns a dict whose
+    # status is "entered", "exited" or "not_parked". An exit read that only
+    # matched an open session approximately carries the plate as recorded at
+    # entry in "matched_plate".
+    if direction not in ("entry", "exit"):
+        raise ValueError("direction must be 'entry' or 'exit'")
+    recorded_at = recorded_at or now()
+    if direction == "entry":
+        record_id = insert_vehicle_record(plate_number, recorded_at)
+        return {"status": "entered", "plate_number": plate_number, "record_id": record_id,
+                "entry_time": recorded_at}
+
+    entry_time, matched_plate = close_open_session(plate_number, recorded_at)
+    if not entry_time:
+        return {"status": "not_parked", "plate_number": plate_number, "exit_time": recorded_at}
+    entry, exit = parse_time(entry_time), parse_time(recorded_at)
+    return {"status": "exited", "plate_number": plate_number,
+            "matched_plate": matched_plate if matched_plate != plate_number else None,
+            "entry_time": entry_time, "exit_time": recorded_at,
+            "duration_seconds": int((exit - entry).total_seconds()) if entry and exit else None,
+            "duration": calculate_duration(entry, exit) if entry and exit else None}
+
+
+def recognize(image):
+    # image: encoded jpg/png bytes (or any buffer over them).
+    return plate_engine.recognize_cached(np.frombuffer(image, dtype=np.uint8), plate_engine.get_reader())
+
+
+def process_gate_image(image, direction, recorded_at=None):
+    # Recognize the plate and record the passage in one call. Status
+    # "no_plate" when nothing could be read, otherwise as record_plate().
+    recorded_at = recorded_at or now()
+    result = recognize(image)
+    if not result["plate_number"]:
+        return {"status": "no_plate", "plate_number": None, "confidence": result["confidence"]}
+    outcome = record_plate(result["plate_number"], direction, recorded_at)
+    outcome["confidence"] = result["confidence"]
+    return outcome
+
+
+def record_entry(image, recorded_at=None):
+    return process_gate_image(image, "entry", recorded_at)
+
+
+def record_exit(image, recorded_at=None):
+    return process_gate_image(image, "exit", recorded_at)
+
+
+def report_summary(first_day, last_day=None):
+    # Report figures for first_day..last_day ("YYYY-MM-DD").
+    return get_rollup_summary(first_day, last_day or first_day)
+
+
+def occupancy(longest=10):
+    # Cars parked now, today's entries and exits and the longest stays.
+    return get_occupancy(longest=longest)
+
+
+class GateRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection open; every response
+    # therefore carries a Content-Length.
+    protocol_version = "HTTP/1.1"
+    server_version = "StationnementGate/1.0"
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if not api_token:
+            return True
+        supplied = self.headers.get("Authorization", "")
+        if hmac.compare_digest(supplied.encode(), f"Bearer {api_token}".encode()):
+            return True
+        self._send(401, {"error": "missing or wrong API token"})
+        return False
+
+    def do_POST(self):
+        # Nothing is read from the body before the client is authorized and
+        # its length checked; a body left unread cannot be told apart from
+        # the next request, so the connection is closed instead.
+        path = urlparse(self.path).path
+        if not self._authorized():
+            self.close_connection = True
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._send(400, {"error": "Content-Length must be a number of bytes"})
+            return
+        if length > max_upload_bytes:
+            self.close_connection = True
+            self._send(413, {"error": f"images over {max_upload_bytes} bytes are refused"})
+            return
+        image = self.rfile.read(length)
+        if path not in ("/entry", "/exit"):
+            self._send(404, {"error": f"no such endpoint: {path}"})
+            return
+        if not image:
+            self._send(400, {"error": "POST the jpg or png image as the request body"})
+            return
+        try:
+            with metrics.timer(f"http.{path[1:]}"):
+                outcome = process_gate_image(image, path[1:])
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, outcome)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self._send(200, {"status": "ok"})
+            return
+        if not self._authorized():
+            return
+        if url.path == "/metrics":
+            self._send(200, metrics.prometheus_text().encode(), "text/plain; version=0.0.4")
+        elif url.path == "/occupancy":
+            self._send(200, occupancy())
+        elif url.path == "/report":
+            query = parse_qs(url.query)
+            first_day = query.get("from", [datetime.date.today().isoformat()])[0]
+            last_day = query.get("to", [first_day])[0]
+            self._send(200, report_summary(first_day, last_day))
+        else:
+            self._send(404, {"error": f"no such endpoint: {url.path}"})
+
+    def log_message(self, format, *args):
+        # Per-request timings go to the metrics instead of stderr.
+        pass
+
+
+class GateServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def serve(host=default_host, port=default_port):
+    # Load the OCR model before the first barrier is waiting on it.
+    plate_engine.get_reader()
+    server = GateServer((host, port), GateRequestHandler)
+    print(f"Gate service listening on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record gate passages from images without the web app.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the HTTP API for gate devices")
+    serve_parser.add_argument("--host", default=default_host)
+    serve_parser.add_argument("--port", type=int, default=default_port)
+    for direction in ("entry", "exit"):
+        gate_parser = commands.add_parser(direction, help=f"record the {direction} of the vehicle in an image")
+        gate_parser.add_argument("image", help="jpg or png file")
+    report_parser = commands.add_parser("report", help="print report figures as JSON")
+    report_parser.add_argument("first_day", help="YYYY-MM-DD")
+    report_parser.add_argument("last_day", nargs="?", help="YYYY-MM-DD (default: first_day)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.host, args.port)
+    elif args.command == "report":
+        print(json.dumps(report_summary(args.first_day, args.last_day), indent=2))
+    else:
+        with open(args.image, "rb") as image_file:
+            print(json.dumps(process_gate_image(image_file.read(), args.command), indent=2))
+
+
+if __name__ == "__main__":
+    main()
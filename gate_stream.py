@@ -0,0 +1,174 @@
+import time
+import queue
+import logging
+import argparse
+import threading
+
+import cv2
+
+import gate_service
+import plate_match
+import plate_engine
+
+logger = logging.getLogger("stationnement.gate_stream")
+
+# The gate camera sees the same car for many consecutive frames; sightings of
+# one plate closer together than this many seconds count as a single passage.
+default_dedup_window = 30.0
+default_sample_interval = 0.5
+max_sample_interval = 8.0
+
+
+class PlateDeduplicator:
+    def __init__(self, window):
+        self.window = window
+        self.last_seen = {}
+
+    def is_new(self, plate_number, timestamp):
+        # Every sighting pushes the window forward, so a car idling in front
+        # of the barrier is still recorded only once.
+        key = plate_match.plate_key(plate_number)
+        last = self.last_seen.get(key)
+        self.last_seen[key] = timestamp
+        if len(self.last_seen) > 1024:
+            self.last_seen = {plate: seen for plate, seen in self.last_seen.items()
+                              if timestamp - seen <= self.window}
+        return last is None or timestamp - last > self.window
+
+
+def is_live_source(source):
+    return isinstance(source, int) or '://' in str(source)
+
+
+def record_plate(plate_number, direction):
+    now = gate_service.now()
+    gate_service.record_plate(plate_number, direction, now)
+    return now
+
+
+def ingest_stream(source, direction='entry', reader=None,
+                  sample_interval=default_sample_interval,
+                  dedup_window=default_dedup_window,
+                  max_backlog=2, realtime=None, on_record=None):
+    if direction not in ('entry', 'exit'):
+        raise ValueError("direction must be 'entry' or 'exit'")
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video source {source!r}")
+
+    if realtime is None:
+        realtime = is_live_source(source)
+    if reader is None:
+        reader = plate_engine.get_reader()
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frames = queue.Queue(maxsize=max_backlog)
+    dedup = PlateDeduplicator(dedup_window)
+    stats = {"frames": 0, "sampled": 0, "skipped": 0, "recognized": 0,
+             "recorded": 0, "errors": 0}
+
+    def recognize_frames():
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            stream_time, frame = item
+            try:
+                result = plate_engine.recognize_frame(frame, reader)
+                plate_engine.record_metrics(result)
+                plate_number = result["plate_number"]
+                if plate_number:
+                    stats["recognized"] += 1
+                    if dedup.is_new(plate_number, stream_time):
+                        recorded_at = record_plate(plate_number, direction)
+                        stats["recorded"] += 1
+                        if on_record:
+                            on_record(plate_number, recorded_at)
+            except Exception:
+                # Counted, and logged with the traceback, so a passage that
+                # was missed (OCR failure, database locked, ...) can be traced.
+                stats["errors"] += 1
+                logger.exception("Could not read or record the frame at %.1f s of %r (%s)",
+                                 stream_time, source, direction)
+
+    worker = threading.Thread(target=recognize_frames, daemon=True)
+    worker.start()
+
+    interval = sample_interval
+    next_sample = 0.0
+    started = time.monotonic()
+    try:
+        while True:
+            # grab() only demuxes the frame; decoding is paid for the sampled
+            # frames alone in retrieve() below.
+            if not cap.grab():
+                break
+            stream_time = stats["frames"] / fps
+            stats["frames"] += 1
+
+            if realtime and not is_live_source(source):
+                # Replay files at camera pace so the skipping behaves as live.
+                delay = started + stream_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if stream_time < next_sample:
+                continue
+
+            if realtime:
+                # OCR is falling behind the camera: drop this frame and sample
+                # less often until the backlog drains again.
+                if frames.full():
+                    stats["skipped"] += 1
+                    interval = min(interval * 2, max_sample_interval)
+                    next_sample = stream_time + interval
+                    continue
+                if frames.empty():
+                    interval = max(sample_interval, interval / 2)
+
+            ok, frame = cap.retrieve()
+            if not ok:
+                continue
+            frames.put((stream_time, frame))
+            stats["sampled"] += 1
+            next_sample = stream_time + interval
+    finally:
+        frames.put(None)
+        worker.join()
+        cap.release()
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record vehicles from a gate camera stream or video file.")
+    parser.add_argument("source", help="video file, stream URL or camera index")
+    parser.add_argument("--direction", choices=("entry", "exit"), default="entry")
+    parser.add_argument("--sample-interval", type=float, default=default_sample_interval,
+                        help="seconds of video between sampled frames")
+    parser.add_argument("--dedup-window", type=float, default=default_dedup_window,
+                        help="seconds within which repeated sightings of a plate are merged")
+    parser.add_argument("--max-backlog", type=int, default=2,
+                        help="frames waiting for OCR before frames are skipped")
+    parser.add_argument("--realtime", action="store_true",
+                        help="replay a video file at its frame rate and skip frames like a live stream")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    source = int(args.source) if args.source.isdigit() else args.source
+
+    def report(plate_number, recorded_at):
+        print(f"Vehicle with plate number {plate_number} recorded ({args.direction}) at {recorded_at}")
+
+    stats = ingest_stream(source, direction=args.direction,
+                          sample_interval=args.sample_interval,
+                          dedup_window=args.dedup_window,
+                          max_backlog=args.max_backlog,
+                          realtime=True if args.realtime else None,
+                          on_record=report)
+    print(", ".join(f"{key}: {value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
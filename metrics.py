@@ -0,0 +1,169 @@
+import os
+import json
+import math
+import time
+import logging
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+# Per-stage latency samples and event counters for the recognition pipeline
+# and the database helpers. Samples are kept for a rolling window so the
+# percentiles follow current behaviour; totals since start-up are kept as
+# well for the Prometheus export. Every observation is also logged as one
+# JSON line on the "stationnement.metrics" logger at DEBUG level.
+window_seconds = 900
+max_samples = 4096
+
+# When set, the Prometheus text format is rewritten to this file every
+# export_interval seconds (for node_exporter's textfile collector and such).
+metrics_file = os.environ.get("STATIONNEMENT_METRICS_FILE")
+export_interval = 15.0
+
+logger = logging.getLogger("stationnement.metrics")
+
+_samples = {}
+_totals = {}
+_counters = {}
+_lock = threading.Lock()
+_exporter = None
+
+
+def observe(stage, seconds):
+    now = time.time()
+    with _lock:
+        samples = _samples.get(stage)
+        if samples is None:
+            samples = _samples[stage] = deque(maxlen=max_samples)
+        samples.append((now, seconds))
+        count, total = _totals.get(stage, (0, 0.0))
+        _totals[stage] = (count + 1, total + seconds)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps({"ts": round(now, 3), "stage": stage, "seconds": round(seconds, 6)}))
+    _ensure_exporter()
+
+
+def observe_timings(prefix, timings):
+    # Record a {stage: seconds} dict such as plate_engine results carry; this
+    # is how timings measured in OCR worker processes reach this process.
+    for stage, seconds in timings.items():
+        observe(f"{prefix}.{stage}", seconds)
+
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps({"ts": round(time.time(), 3), "counter": name, "amount": amount}))
+
+
+@contextmanager
+def timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        increment(f"{stage}.errors")
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list.
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summary(window=None):
+    # One row per stage over the last window seconds, slowest p95 first.
+    cutoff = time.time() - (window or window_seconds)
+    with _lock:
+        recent = {stage: [seconds for seen, seconds in samples if seen >= cutoff]
+                  for stage, samples in _samples.items()}
+    rows = []
+    for stage, values in recent.items():
+        if not values:
+            continue
+        values.sort()
+        rows.append({"stage": stage, "count": len(values),
+                     "p50": _percentile(values, 0.50),
+                     "p95": _percentile(values, 0.95),
+                     "p99": _percentile(values, 0.99),
+                     "max": values[-1]})
+    rows.sort(key=lambda row: row["p95"], reverse=True)
+    return rows
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def _metric_name(name):
+    return "".join(character if character.isalnum() else "_" for character in name)
+
+
+def prometheus_text():
+    lines = ["# HELP stationnement_stage_seconds Latency per pipeline stage over the rolling window.",
+             "# TYPE stationnement_stage_seconds summary"]
+    rows = {row["stage"]: row for row in summary()}
+    with _lock:
+        totals = dict(_totals)
+        counts = dict(_counters)
+    for stage in sorted(totals):
+        row = rows.get(stage)
+        if row:
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(f'stationnement_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {row[key]:.6f}')
+        count, total = totals[stage]
+        lines.append(f'stationnement_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append(f'stationnement_stage_seconds_count{{stage="{stage}"}} {count}')
+    for name in sorted(counts):
+        metric = f"stationnement_{_metric_name(name)}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {counts[name]}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    # Write to a temporary file first so a scraper never reads half a file.
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as metrics_out:
+        metrics_out.write(prometheus_text())
+    os.replace(temporary, path)
+
+
+def _export_loop():
+    while True:
+        time.sleep(export_interval)
+        try:
+            write_prometheus(metrics_file)
+        except OSError:
+            logger.exception("Could not write metrics to %s", metrics_file)
+
+
+def _ensure_exporter():
+    global _exporter
+    if metrics_file and _exporter is None:
+        with _lock:
+            if _exporter is None:
+                _exporter = threading.Thread(target=_export_loop, name="metrics-export", daemon=True)
+                _exporter.start()
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _counters.clear()
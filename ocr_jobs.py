@@ -0,0 +1,140 @@
+import os
+import uuid
+import queue
+import datetime
+import threading
+from collections import OrderedDict
+
+import gate_service
+import plate_engine
+from parking_db import time_format
+
+# Uploads are queued here and recognized on a background thread, so the
+# page returns as soon as the images are handed over. The thread drains
+# whatever has queued up since its last pass and sends it through
+# plate_engine.recognize_batch, which spreads larger bursts over the worker
+# processes. Jobs live in memory only and the oldest are forgotten first.
+batch_size = int(os.environ.get("OCR_JOB_BATCH", 8))
+max_jobs_kept = 1000
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="ocr-jobs", daemon=True)
+            _worker.start()
+
+
+def _update(job_id, **changes):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(changes)
+
+
+def submit(image, direction, name=None):
+    # Queue one encoded image (any bytes-like buffer) for the entry or exit
+    # gate; returns the job id.
+    if direction not in ("entry", "exit"):
+        raise ValueError("direction must be 'entry' or 'exit'")
+    job_id = uuid.uuid4().hex[:12]
+    job = {
+        "id": job_id,
+        "name": name or job_id,
+        "direction": direction,
+        "status": "queued",
+        # The vehicle is recorded at the time it was uploaded, not at the
+        # time the queue got round to it.
+        "submitted_at": datetime.datetime.now().strftime(time_format),
+        "plate_number": None,
+        "messages": [],
+    }
+    with _jobs_lock:
+        _jobs[job_id] = job
+        while len(_jobs) > max_jobs_kept:
+            _jobs.popitem(last=False)
+    # A view, not a copy: the upload buffer stays alive until the job is done.
+    _queue.put((job_id, memoryview(image)))
+    _ensure_worker()
+    return job_id
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+
+def get_jobs(job_ids):
+    with _jobs_lock:
+        return [dict(_jobs[job_id]) for job_id in job_ids if job_id in _jobs]
+
+
+def pending_count():
+    return _queue.qsize()
+
+
+def outcome_messages(outcome):
+    # The (kind, message) pairs to show the operator for a
+    # gate_service.record_plate() outcome, kind being a Streamlit message
+    # function name.
+    plate_number = outcome["plate_number"]
+    if outcome["status"] == "entered":
+        return [("success", f"Vehicle with plate number {plate_number} recorded at {outcome['entry_time']}")]
+    if outcome["status"] == "not_parked":
+        return [("warning", f"No vehicle with plate number {plate_number} is currently parked.")]
+    messages = [("success", f"Vehicle with plate number {plate_number} exited at {outcome['exit_time']}")]
+    if outcome["matched_plate"]:
+        messages.append(("info", f"Matched to the vehicle recorded at entry as {outcome['matched_plate']}"))
+    if outcome["duration"]:
+        messages.append(("info", f"Duration of Stay: {outcome['duration']}"))
+    return messages
+
+
+def _run():
+    while True:
+        batch = [_queue.get()]
+        while len(batch) < batch_size:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        for job_id, _ in batch:
+            _update(job_id, status="running")
+        try:
+            results = plate_engine.recognize_batch([data for _, data in batch],
+                                                   reader=plate_engine.get_reader())
+        except Exception as e:
+            # The model could not be loaded; failures of single images come
+            # back in their results instead.
+            for job_id, _ in batch:
+                _update(job_id, status="failed", messages=[("error", f"Plate recognition failed: {e}")])
+            continue
+
+        for (job_id, _), result in zip(batch, results):
+            job = get_job(job_id)
+            if job is None:
+                continue
+            plate_number = result["plate_number"]
+            if result.get("error"):
+                _update(job_id, status="failed",
+                        messages=[("error", f"Plate recognition failed for {job['name']}: {result['error']}")])
+                continue
+            try:
+                if plate_number:
+                    messages = outcome_messages(gate_service.record_plate(plate_number, job["direction"],
+                                                                          job["submitted_at"]))
+                else:
+                    messages = [("warning", f"No license plate detected in {job['name']}.")]
+                _update(job_id, status="done", plate_number=plate_number, messages=messages)
+            except Exception as e:
+                _update(job_id, status="failed", plate_number=plate_number,
+                        messages=[("error", f"An error occurred while recording {job['name']}: {e}")])
@@ -0,0 +1,877 @@
+import os
+import time
+import csv
+import queue
+import sqlite3
+import argparse
+import datetime
+import threading
+from contextlib import contextmanager
+
+import metrics
+import plate_match
+
+db_path = os.environ.get("STATIONNEMENT_DB", "stationnement_database.db")
+
+# Streamlit runs every session (and every rerun) on its own thread, and the
+# headless tools add worker threads of their own, so connections are handed
+# out from a small pool instead of sharing one. In WAL mode readers never
+# wait for the writer; writers queue on the busy timeout instead of failing.
+pool_size = 8
+busy_timeout = 5.0
+
+time_format = "%Y-%m-%d %H:%M:%S"
+
+# Stay durations are summarised per day as a histogram of 15 minute buckets;
+# the last bucket collects every stay of a day or longer.
+stay_bucket_seconds = 900
+stay_bucket_count = 96
+
+# Exits whose plate read does not match an open session exactly are matched
+# by plate_match key, then to the closest open key within an edit distance
+# using an in-memory index. The index is loaded on first use, kept up to
+# date by the writes made here and reloaded every open_index_resync seconds
+# to pick up writes made by other processes. It remembers which record ids
+# it holds, so a write applied to it after a reload that already saw the
+# write changes nothing.
+open_index_resync = 60.0
+
+_pool = queue.LifoQueue()
+_pool_lock = threading.Lock()
+_schema_ready = False
+_write_generation = 0
+_open_index = None
+_open_index_ids = {}
+_open_index_loaded = 0.0
+_open_index_lock = threading.Lock()
+
+def _open_connection():
+    # Autocommit mode: transactions are started explicitly by transaction().
+    conn = sqlite3.connect(db_path, timeout=busy_timeout, check_same_thread=False,
+                           isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+    return conn
+
+def _checkout():
+    global _schema_ready
+    if not _schema_ready:
+        with _pool_lock:
+            if not _schema_ready:
+                conn = _open_connection()
+                try:
+                    _create_schema(conn)
+                    migrate(conn)
+                finally:
+                    conn.close()
+                _schema_ready = True
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _open_connection()
+
+def _checkin(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    if _pool.qsize() < pool_size:
+        _pool.put(conn)
+    else:
+        conn.close()
+
+@contextmanager
+def connection():
+    # Borrow a pooled connection for a few statements.
+    conn = _checkout()
+    try:
+        yield conn
+    finally:
+        _checkin(conn)
+
+@contextmanager
+def transaction():
+    # BEGIN IMMEDIATE takes the write lock up front, so what a write helper
+    # reads before writing cannot change underneath it.
+    with connection() as conn:
+        # Time spent waiting here is time spent queued behind other writers.
+        with metrics.timer("db.write_lock"):
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    _bump_write_generation()
+
+def _bump_write_generation():
+    global _write_generation
+    with _pool_lock:
+        _write_generation += 1
+
+def write_generation():
+    # Goes up after every write committed by this process; caches of query
+    # results key on it. Writes by other processes are not seen, so such
+    # caches also need a short time to live.
+    return _write_generation
+
+def configure(path):
+    # Point the module at another database file (tools, tests, benchmarks).
+    global db_path, _schema_ready
+    with _pool_lock:
+        while True:
+            try:
+                _pool.get_nowait().close()
+            except queue.Empty:
+                break
+        db_path = path
+        _schema_ready = False
+    _forget_open_index()
+    _bump_write_generation()
+
+def _create_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS users
+                    (username TEXT PRIMARY KEY, password TEXT)''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS vehicles
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    plate_number TEXT,
+                    entry_time DATETIME,
+                    exit_time DATETIME)''')
+
+@metrics.timed("db.get_user")
+def get_user(username):
+    with connection() as conn:
+        return conn.execute("SELECT * FROM users WHERE username=?", (username,)).fetchone()
+
+@metrics.timed("db.add_user")
+def add_user(username, hashed_password):
+    with transaction() as conn:
+        conn.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                     (username, hashed_password))
+
+@metrics.timed("db.is_admin")
+def is_admin(username):
+    with connection() as conn:
+        row = conn.execute("SELECT is_admin FROM users WHERE username=?", (username,)).fetchone()
+    return bool(row and row[0])
+
+def set_admin(username, admin=True):
+    # Returns False when there is no such user.
+    with transaction() as conn:
+        updated = conn.execute("UPDATE users SET is_admin=? WHERE username=?", (int(admin), username))
+    return updated.rowcount > 0
+
+def open_plate_index():
+    global _open_index, _open_index_ids, _open_index_loaded
+    with _open_index_lock:
+        if _open_index is None or time.monotonic() - _open_index_loaded > open_index_resync:
+            with connection() as conn:
+                _open_index_ids = dict(conn.execute("SELECT id, plate_key FROM vehicles WHERE exit_time IS NULL"))
+            _open_index = plate_match.PlateIndex(_open_index_ids.values())
+            _open_index_loaded = time.monotonic()
+        return _open_index
+
+def _forget_open_index():
+    global _open_index, _open_index_ids
+    with _open_index_lock:
+        _open_index = None
+        _open_index_ids = {}
+
+def _index_opened(record_id, key):
+    # Called after the insert is committed. Nothing to do while no index is
+    # loaded: the next load reads the row.
+    with _open_index_lock:
+        if _open_index is not None and record_id not in _open_index_ids:
+            _open_index_ids[record_id] = key
+            _open_index.add(key)
+
+def _index_closed(record_ids):
+    with _open_index_lock:
+        for record_id in record_ids:
+            if _open_index is not None and record_id in _open_index_ids:
+                _open_index.remove(_open_index_ids.pop(record_id))
+
+def _close_sessions(conn, column, value, exit_time, one_plate=False):
+    # With one_plate, closes nothing when the open sessions found were
+    # recorded under more than one plate: several plates fold to the same
+    # key, and closing the wrong car's session is worse than no match.
+    sessions = conn.execute(f"SELECT plate_number, plate_key, entry_time, id FROM vehicles WHERE {column} = ? "
+                            "AND exit_time IS NULL ORDER BY entry_time DESC", (value,)).fetchall()
+    if one_plate and len({session[0] for session in sessions}) > 1:
+        metrics.increment("db.ambiguous_exit_matches")
+        return []
+    if sessions:
+        conn.execute(f"UPDATE vehicles SET exit_time = ? WHERE {column} = ? AND exit_time IS NULL",
+                     (exit_time, value))
+        _add_parked(conn, -len(sessions))
+        for session in sessions:
+            _rollup_exit(conn, session[2], exit_time, 1)
+    return sessions
+
+@metrics.timed("db.close_open_session")
+def close_open_session(plate_number, exit_time, fuzzy=True):
+    # Closes the open session(s) of the plate and returns (entry_time,
+    # plate_number) of the latest one as it was recorded at entry, or
+    # (None, None) when nothing matched. Tries the exact plate, then its
+    # plate_match key, then (with fuzzy) the closest open key; a key open
+    # under several plates matches none of them. Each step is an indexed
+    # lookup on open sessions only. The closest key is looked up
+    # in the in-memory index before the write lock is taken, so no other
+    # writer waits on the edit distances.
+    key = plate_match.plate_key(plate_number)
+    match = open_plate_index().best_match(key) if key and fuzzy else None
+    with transaction() as conn:
+        sessions = _close_sessions(conn, "plate_number", plate_number, exit_time)
+        if not sessions and key:
+            sessions = _close_sessions(conn, "plate_key", key, exit_time, one_plate=True)
+        if not sessions and match and match != key:
+            sessions = _close_sessions(conn, "plate_key", match, exit_time, one_plate=True)
+            if sessions:
+                metrics.increment("db.fuzzy_exit_matches")
+    if not sessions:
+        return None, None
+    _index_closed(session[3] for session in sessions)
+    return sessions[0][2], sessions[0][0]
+
+@metrics.timed("db.update_vehicle_record_exit_time")
+def update_vehicle_record_exit_time(plate_number, exit_time):
+    # Returns the entry_time of the latest session closed, or None when the
+    # plate has no open session; see close_open_session().
+    return close_open_session(plate_number, exit_time)[0]
+
+@metrics.timed("db.insert_vehicle_record")
+def insert_vehicle_record(plate_number, entry_time):
+    # AUTOINCREMENT hands out the id, so an insert is one statement and one
+    # commit no matter how many rows the table holds.
+    key = plate_match.plate_key(plate_number)
+    with transaction() as conn:
+        record_id = conn.execute("INSERT INTO vehicles (plate_number, plate_key, entry_time) VALUES (?, ?, ?)",
+                                 (plate_number, key, entry_time)).lastrowid
+        _rollup_record(conn, entry_time, None, 1)
+    _index_opened(record_id, key)
+    return record_id
+
+@metrics.timed("db.get_vehicle_record")
+def get_vehicle_record(record_id):
+    with connection() as conn:
+        return conn.execute("SELECT id, plate_number, entry_time, exit_time FROM vehicles WHERE id=?",
+                            (record_id,)).fetchone()
+
+@metrics.timed("db.update_vehicle_record")
+def update_vehicle_record(record_id, plate_number, entry_time, exit_time):
+    exit_time = exit_time or None
+    with transaction() as conn:
+        old = conn.execute("SELECT * FROM vehicles WHERE id=?", (record_id,)).fetchone()
+        if old is None:
+            return False
+        conn.execute("UPDATE vehicles SET plate_number=?, plate_key=?, entry_time=?, exit_time=? WHERE id=?",
+                     (plate_number, plate_match.plate_key(plate_number), entry_time, exit_time, record_id))
+        _rollup_record(conn, old[2], old[3], -1)
+        _rollup_record(conn, entry_time, exit_time, 1)
+    _forget_open_index()
+    return True
+
+@metrics.timed("db.delete_vehicle_record")
+def delete_vehicle_record(record_id):
+    # Ids are stable and never renumbered; gaps left by deletes are expected.
+    with transaction() as conn:
+        old = conn.execute("SELECT * FROM vehicles WHERE id=?", (record_id,)).fetchone()
+        if old is None:
+            return False
+        conn.execute("DELETE FROM vehicles WHERE id=?", (record_id,))
+        _rollup_record(conn, old[2], old[3], -1)
+    if old[3] is None:
+        _forget_open_index()
+    return True
+
+def calculate_duration(entry_time, exit_time):
+    duration = exit_time - entry_time
+    days, seconds = duration.days, duration.seconds
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    duration_string = f"{days} days, {hours} hours, {minutes} minutes"
+    return duration_string
+
+def parse_time(text):
+    try:
+        return datetime.datetime.strptime(text, time_format)
+    except (TypeError, ValueError):
+        return None
+
+def _stay_bucket(seconds):
+    return min(int(seconds) // stay_bucket_seconds, stay_bucket_count)
+
+# The rollup tables are kept in step with vehicles inside the same
+# transaction as every write, so reports only read these small tables:
+#   occupancy      one row: the number of sessions still open
+#   daily_rollup   vehicles entered / exited per day, plus the number and
+#                  total length of the closed stays that began that day
+#   hourly_rollup  entries and exits per hour, for occupancy
+#   stay_histogram closed stays per entry day and duration bucket
+# Records whose times do not parse are left out, on the way in and out alike.
+
+def _add_to_rollups(conn, day, hour, entries=0, exits=0, stays=0, stay_seconds=0):
+    conn.execute("INSERT INTO daily_rollup (day, entries, exits, stays, stay_seconds) VALUES (?, ?, ?, ?, ?) "
+                 "ON CONFLICT(day) DO UPDATE SET entries = entries + excluded.entries, "
+                 "exits = exits + excluded.exits, stays = stays + excluded.stays, "
+                 "stay_seconds = stay_seconds + excluded.stay_seconds",
+                 (day, entries, exits, stays, stay_seconds))
+    if entries or exits:
+        conn.execute("INSERT INTO hourly_rollup (day, hour, entries, exits) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT(day, hour) DO UPDATE SET entries = entries + excluded.entries, "
+                     "exits = exits + excluded.exits",
+                     (day, hour, entries, exits))
+
+def _rollup_exit(conn, entry_time, exit_time, sign):
+    entry = parse_time(entry_time)
+    exit = parse_time(exit_time)
+    if entry is None or exit is None:
+        return
+    _add_to_rollups(conn, exit_time[:10], exit.hour, exits=sign)
+    stay_seconds = (exit - entry).total_seconds()
+    if stay_seconds >= 0:
+        _add_to_rollups(conn, entry_time[:10], entry.hour, stays=sign, stay_seconds=sign * int(stay_seconds))
+        conn.execute("INSERT INTO stay_histogram (day, bucket, stays) VALUES (?, ?, ?) "
+                     "ON CONFLICT(day, bucket) DO UPDATE SET stays = stays + excluded.stays",
+                     (entry_time[:10], _stay_bucket(stay_seconds), sign))
+
+def _add_parked(conn, change):
+    conn.execute("UPDATE occupancy SET parked = parked + ?, updated_at = ? WHERE id = 1",
+                 (change, datetime.datetime.now().strftime(time_format)))
+
+def _fill_occupancy(conn):
+    parked = conn.execute("SELECT COUNT(*) FROM vehicles WHERE exit_time IS NULL").fetchone()[0]
+    conn.execute("INSERT OR REPLACE INTO occupancy (id, parked, updated_at) VALUES (1, ?, ?)",
+                 (parked, datetime.datetime.now().strftime(time_format)))
+
+def _rollup_record(conn, entry_time, exit_time, sign):
+    # Every record without an exit counts as parked, whatever its times.
+    if not exit_time:
+        _add_parked(conn, sign)
+    entry = parse_time(entry_time)
+    if entry is None:
+        return
+    _add_to_rollups(conn, entry_time[:10], entry.hour, entries=sign)
+    if exit_time:
+        _rollup_exit(conn, entry_time, exit_time, sign)
+
+def _tally_rollups(rows):
+    # The rollup rows for a set of (entry_time, exit_time) records, counted
+    # in memory: ({day: [entries, exits, stays, stay_seconds]},
+    # {(day, hour): [entries, exits]}, {(day, bucket): stays}).
+    daily = {}
+    hourly = {}
+    histogram = {}
+    for entry_time, exit_time in rows:
+        entry = parse_time(entry_time)
+        if entry is None:
+            continue
+        day = entry_time[:10]
+        daily.setdefault(day, [0, 0, 0, 0])[0] += 1
+        hourly.setdefault((day, entry.hour), [0, 0])[0] += 1
+        exit = parse_time(exit_time) if exit_time else None
+        if exit is None:
+            continue
+        daily.setdefault(exit_time[:10], [0, 0, 0, 0])[1] += 1
+        hourly.setdefault((exit_time[:10], exit.hour), [0, 0])[1] += 1
+        stay_seconds = (exit - entry).total_seconds()
+        if stay_seconds >= 0:
+            daily[day][2] += 1
+            daily[day][3] += int(stay_seconds)
+            key = (day, _stay_bucket(stay_seconds))
+            histogram[key] = histogram.get(key, 0) + 1
+    return daily, hourly, histogram
+
+def _merge_rollups(conn, daily, hourly, histogram):
+    # Adds tallies from _tally_rollups() onto the rollup tables.
+    conn.executemany("INSERT INTO daily_rollup (day, entries, exits, stays, stay_seconds) VALUES (?, ?, ?, ?, ?) "
+                     "ON CONFLICT(day) DO UPDATE SET entries = entries + excluded.entries, "
+                     "exits = exits + excluded.exits, stays = stays + excluded.stays, "
+                     "stay_seconds = stay_seconds + excluded.stay_seconds",
+                     [(day,) + tuple(values) for day, values in daily.items()])
+    conn.executemany("INSERT INTO hourly_rollup (day, hour, entries, exits) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT(day, hour) DO UPDATE SET entries = entries + excluded.entries, "
+                     "exits = exits + excluded.exits",
+                     [key + tuple(values) for key, values in hourly.items()])
+    conn.executemany("INSERT INTO stay_histogram (day, bucket, stays) VALUES (?, ?, ?) "
+                     "ON CONFLICT(day, bucket) DO UPDATE SET stays = stays + excluded.stays",
+                     [key + (stays,) for key, stays in histogram.items()])
+
+def _fill_rollups(conn):
+    # Stream the rows, archived ones included; memory grows with the number
+    # of days, not of rows.
+    rows = conn.execute(" UNION ALL ".join(f"SELECT entry_time, exit_time FROM {table}"
+                                           for table in ["vehicles"] + _archive_tables(conn)))
+    daily, hourly, histogram = _tally_rollups(rows)
+    conn.execute("DELETE FROM daily_rollup")
+    conn.execute("DELETE FROM hourly_rollup")
+    conn.execute("DELETE FROM stay_histogram")
+    _merge_rollups(conn, daily, hourly, histogram)
+
+@metrics.timed("db.rebuild_rollups")
+def rebuild_rollups():
+    # Backfill: recompute every rollup table from the vehicles table.
+    with transaction() as conn:
+        _fill_rollups(conn)
+        _fill_occupancy(conn)
+        return conn.execute("SELECT COUNT(*) FROM daily_rollup").fetchone()[0]
+
+def _stay_percentile(buckets, total, fraction):
+    # The stay below which the given fraction of stays fall, interpolated
+    # linearly within its histogram bucket. The last bucket has no upper
+    # edge, so a percentile falling in it is reported as one day.
+    if not total:
+        return None
+    target = fraction * total
+    seen = 0
+    for bucket, stays in buckets:
+        if stays and seen + stays >= target:
+            if bucket >= stay_bucket_count:
+                return stay_bucket_count * stay_bucket_seconds
+            return (bucket + (target - seen) / stays) * stay_bucket_seconds
+        seen += stays
+    return None
+
+@metrics.timed("db.get_rollup_summary")
+def get_rollup_summary(first_day, last_day):
+    # Report figures for the days first_day..last_day ("YYYY-MM-DD"),
+    # read from the rollup tables only.
+    with connection() as conn:
+        days = conn.execute("SELECT day, entries, exits, stays, stay_seconds FROM daily_rollup "
+                            "WHERE day BETWEEN ? AND ? ORDER BY day", (first_day, last_day)).fetchall()
+
+        buckets = conn.execute("SELECT bucket, SUM(stays) FROM stay_histogram WHERE day BETWEEN ? AND ? "
+                               "GROUP BY bucket ORDER BY bucket", (first_day, last_day)).fetchall()
+
+        # Occupancy at each hour is everything that entered minus everything
+        # that left up to then, starting from the count before the range.
+        occupancy = conn.execute("SELECT COALESCE(SUM(entries - exits), 0) FROM daily_rollup WHERE day < ?",
+                                 (first_day,)).fetchone()[0]
+        hours = conn.execute("SELECT day, hour, entries, exits FROM hourly_rollup "
+                             "WHERE day BETWEEN ? AND ? ORDER BY day, hour", (first_day, last_day)).fetchall()
+
+    hourly = []
+    for day, hour, entries, exits in hours:
+        occupancy += entries - exits
+        hourly.append({"hour": f"{day} {hour:02d}:00", "entries": entries, "exits": exits,
+                       "occupancy": occupancy})
+
+    stays = sum(day[3] for day in days)
+    stay_seconds = sum(day[4] for day in days)
+    return {
+        "entries": sum(day[1] for day in days),
+        "exits": sum(day[2] for day in days),
+        "stays": stays,
+        "average_stay_seconds": stay_seconds / stays if stays else None,
+        "median_stay_seconds": _stay_percentile(buckets, stays, 0.5),
+        "p90_stay_seconds": _stay_percentile(buckets, stays, 0.9),
+        "days": [{"day": day, "entries": entries, "exits": exits,
+                  "average_stay_seconds": seconds / count if count else None}
+                 for day, entries, exits, count, seconds in days],
+        "hourly": hourly,
+    }
+
+# Closed sessions older than a few months can be moved out of vehicles into
+# one table per entry month, vehicles_archive_YYYY_MM, so the live table only
+# holds recent history. The rollups are not touched by archiving. Record
+# listings and exports read the archive tables whose month falls in the
+# requested range, along with vehicles; archived records are read-only.
+archive_table_prefix = "vehicles_archive_"
+
+def _archive_tables(conn, time_from=None, time_to=None):
+    # Archive tables whose month overlaps time_from..time_to (either may be
+    # None), oldest first.
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name",
+        (archive_table_prefix + "[0-9][0-9][0-9][0-9]_[0-9][0-9]",))]
+    tables = []
+    for name in names:
+        month = name[len(archive_table_prefix):].replace("_", "-")
+        if time_from and month < time_from[:7]:
+            continue
+        if time_to and month > time_to[:7]:
+            continue
+        tables.append(name)
+    return tables
+
+def _record_sources(conn, time_from=None, time_to=None):
+    return ["vehicles"] + _archive_tables(conn, time_from, time_to)
+
+def _next_month(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12}-{number % 12 + 1:02d}"
+
+@metrics.timed("db.archive_vehicle_records")
+def archive_vehicle_records(months, today=None):
+    # Moves the closed sessions that entered before the first day of the
+    # month `months` months ago into their monthly archive tables, one
+    # transaction per month. Returns {month: rows moved}.
+    today = today or datetime.date.today()
+    month_index = today.year * 12 + today.month - 1 - months
+    cutoff = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}-01 00:00:00"
+    with connection() as conn:
+        months_found = [row[0] for row in conn.execute(
+            "SELECT DISTINCT substr(entry_time, 1, 7) FROM vehicles "
+            "WHERE entry_time < ? AND exit_time IS NOT NULL ORDER BY 1", (cutoff,))]
+
+    moved = {}
+    for month in months_found:
+        # Records whose entry_time is not a date stay where they are.
+        if not (month and len(month) == 7 and month[:4].isdigit() and month[4] == "-" and month[5:].isdigit()):
+            continue
+        table = archive_table_prefix + month.replace("-", "_")
+        start = f"{month}-01 00:00:00"
+        end = min(f"{_next_month(month)}-01 00:00:00", cutoff)
+        with transaction() as conn:
+            conn.execute(f'''CREATE TABLE IF NOT EXISTS {table}
+                            (id INTEGER PRIMARY KEY,
+                            plate_number TEXT,
+                            plate_key TEXT,
+                            entry_time DATETIME,
+                            exit_time DATETIME)''')
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_entry_time ON {table} (entry_time)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_plate ON {table} (plate_number COLLATE NOCASE)")
+            condition = "entry_time >= ? AND entry_time < ? AND exit_time IS NOT NULL"
+            count = conn.execute(f"INSERT INTO {table} (id, plate_number, plate_key, entry_time, exit_time) "
+                                 f"SELECT id, plate_number, plate_key, entry_time, exit_time FROM vehicles "
+                                 f"WHERE {condition}", (start, end)).rowcount
+            conn.execute(f"DELETE FROM vehicles WHERE {condition}", (start, end))
+        moved[month] = count
+    return moved
+
+def _csv_columns(header):
+    # Column positions of plate, entry and exit: from a header such as the
+    # one report exports write, or the first three columns otherwise.
+    names = [name.strip().lower().replace("_", " ") for name in header]
+    if "plate number" in names and "entry time" in names:
+        return (names.index("plate number"), names.index("entry time"),
+                names.index("exit time") if "exit time" in names else None), True
+    return (0, 1, 2 if len(header) > 2 else None), False
+
+def _chain_first(first, rows):
+    yield first
+    yield from rows
+
+@metrics.timed("db.import_vehicle_records")
+def import_vehicle_records(path, batch_size=50000):
+    # Bulk load a CSV of plate, entry time and (optional) exit time rows,
+    # batch_size rows per transaction. Each batch's rollup and occupancy
+    # changes are counted in memory and added in the batch's transaction,
+    # so the write lock is never held for longer than one batch and the
+    # gate keeps recording while an import runs. Ids are assigned afresh;
+    # an empty or "N/A" exit leaves the session open. Rows without a plate
+    # or whose times are not in time_format are skipped. Returns
+    # (records imported, rows skipped).
+    imported = 0
+    skipped = 0
+    with open(path, newline="") as import_file:
+        reader = csv.reader(import_file)
+        first = next(reader, None)
+        if first is None:
+            return 0, 0
+        (plate_column, entry_column, exit_column), has_header = _csv_columns(first)
+
+        def records(rows):
+            nonlocal skipped
+            for row in rows:
+                if len(row) <= max(plate_column, entry_column) or not row[plate_column].strip():
+                    skipped += 1
+                    continue
+                plate_number = row[plate_column].strip()
+                entry_time = row[entry_column].strip()
+                exit_time = row[exit_column].strip() if exit_column is not None and len(row) > exit_column else ""
+                exit_time = exit_time if exit_time and exit_time != "N/A" else None
+                if parse_time(entry_time) is None or (exit_time and parse_time(exit_time) is None):
+                    skipped += 1
+                    continue
+                yield plate_number, plate_match.plate_key(plate_number), entry_time, exit_time
+
+        rows = records(reader if has_header else _chain_first(first, reader))
+        while True:
+            batch = [record for _, record in zip(range(batch_size), rows)]
+            if not batch:
+                break
+            tallies = _tally_rollups((record[2], record[3]) for record in batch)
+            parked = sum(1 for record in batch if record[3] is None)
+            with transaction() as conn:
+                conn.executemany("INSERT INTO vehicles (plate_number, plate_key, entry_time, exit_time) "
+                                 "VALUES (?, ?, ?, ?)", batch)
+                _merge_rollups(conn, *tallies)
+                if parked:
+                    _add_parked(conn, parked)
+            imported += len(batch)
+            if parked:
+                _forget_open_index()
+    return imported, skipped
+
+@metrics.timed("db.get_occupancy")
+def get_occupancy(day=None, longest=10):
+    # The live picture for the dashboard: cars parked now, the day's entries
+    # and exits per hour and the longest-staying cars. A fixed number of
+    # small indexed reads, however much history the tables hold.
+    day = day or datetime.date.today().strftime("%Y-%m-%d")
+    with connection() as conn:
+        parked, updated_at = conn.execute("SELECT parked, updated_at FROM occupancy WHERE id = 1").fetchone()
+        hours = conn.execute("SELECT hour, entries, exits FROM hourly_rollup WHERE day = ? ORDER BY hour",
+                             (day,)).fetchall()
+        staying = conn.execute("SELECT id, plate_number, entry_time FROM vehicles WHERE exit_time IS NULL "
+                               "ORDER BY entry_time ASC LIMIT ?", (longest,)).fetchall()
+    return {
+        "parked": parked,
+        "updated_at": updated_at,
+        "day": day,
+        "entries": sum(hour[1] for hour in hours),
+        "exits": sum(hour[2] for hour in hours),
+        "hourly": [{"hour": hour, "entries": entries, "exits": exits} for hour, entries, exits in hours],
+        "longest": [{"id": record_id, "plate_number": plate_number, "entry_time": entry_time}
+                    for record_id, plate_number, entry_time in staying],
+    }
+
+def iter_vehicle_records_between(start_time, end_time, chunk_size=1000):
+    # Yields the records entered in the range, chunk_size rows at a time, so
+    # callers never hold the whole result set in memory. The pooled
+    # connection is held until the generator is exhausted or closed.
+    with connection() as conn:
+        sources = _record_sources(conn, start_time, end_time)
+        query = " UNION ALL ".join(f"SELECT id, plate_number, entry_time, exit_time FROM {table} "
+                                   "WHERE entry_time BETWEEN ? AND ?" for table in sources)
+        cursor = conn.execute(query + " ORDER BY entry_time ASC", (start_time, end_time) * len(sources))
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+def _like_pattern(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+# Past the end of any plate starting with a given prefix, for prefix ranges.
+_prefix_end = "\U0010ffff"
+
+def search_order(plate=None, plate_match='prefix', time_from=None, time_to=None):
+    # The column a search is listed (and paginated) by, after which ties go
+    # by id: the one whose index serves the search. A time range walks
+    # idx_vehicles_entry_time, a plate prefix idx_vehicles_plate; anything
+    # else, including a substring search, goes through the ids.
+    if time_from or time_to:
+        return "entry_time"
+    if plate and plate_match == 'prefix':
+        return "plate_number"
+    return "id"
+
+def search_statement(conn, plate=None, plate_match='prefix', time_from=None, time_to=None,
+                     after=None, limit=50):
+    # The (sql, params) behind search_vehicle_records(), for callers that
+    # run it themselves, e.g. through pandas.
+    order = search_order(plate, plate_match, time_from, time_to)
+    conditions = []
+    params = []
+    if plate and plate_match == 'prefix':
+        # A range rather than LIKE, so idx_vehicles_plate (NOCASE, like
+        # LIKE itself) can be walked in order. With a time range as well,
+        # "+" keeps the planner on the entry_time index the page is
+        # ordered by.
+        column = "+plate_number" if order == "entry_time" else "plate_number"
+        conditions.append(f"{column} >= ? COLLATE NOCASE AND {column} < ? COLLATE NOCASE")
+        params += [plate, plate + _prefix_end]
+    elif plate:
+        conditions.append("plate_number LIKE ? ESCAPE '\\'")
+        params.append('%' + _like_pattern(plate) + '%')
+    if time_from:
+        conditions.append("entry_time >= ?")
+        params.append(time_from)
+    if time_to:
+        conditions.append("entry_time <= ?")
+        params.append(time_to)
+    if after is not None:
+        # after is the last record of the previous page.
+        if order == "entry_time":
+            conditions.append("(entry_time, id) > (?, ?)")
+            params += [after[2], after[0]]
+        elif order == "plate_number":
+            conditions.append("(plate_number COLLATE NOCASE, id) > (?, ?)")
+            params += [after[1], after[0]]
+        else:
+            conditions.append("id > ?")
+            params.append(after[0])
+
+    # Archived records are listed too, from the months in the range only.
+    sources = _record_sources(conn, time_from, time_to)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    query = " UNION ALL ".join("SELECT id, plate_number, entry_time, exit_time FROM " + table + where
+                               for table in sources)
+    order_by = {"entry_time": "entry_time, id", "plate_number": "plate_number COLLATE NOCASE, id", "id": "id"}
+    return f"{query} ORDER BY {order_by[order]} LIMIT ?", params * len(sources) + [limit]
+
+@metrics.timed("db.search_vehicle_records")
+def search_vehicle_records(plate=None, plate_match='prefix', time_from=None, time_to=None,
+                           after=None, limit=50):
+    # One page of records, in the search_order() of the search, starting
+    # after the record `after` (keyset pagination; None for the first
+    # page). Time range and prefix searches read their index in order and
+    # stop at the end of the page or of the range, so a page costs the same
+    # however large the table is and a search matching nothing costs
+    # nothing. A substring search has to scan, but stops once the page is
+    # full.
+    with connection() as conn:
+        query, params = search_statement(conn, plate, plate_match, time_from, time_to, after, limit)
+        return conn.execute(query, params).fetchall()
+
+def _migrate_autoincrement_ids(conn):
+    # Databases created before the id scheme settled may have a vehicles
+    # table without AUTOINCREMENT, where SQLite can hand a deleted id back
+    # out. Rebuild it with the same rows and ids if so.
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='vehicles'").fetchone()[0]
+    if 'AUTOINCREMENT' not in sql.upper():
+        conn.execute('''CREATE TABLE vehicles_migrated
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        plate_number TEXT,
+                        entry_time DATETIME,
+                        exit_time DATETIME)''')
+        conn.execute("INSERT INTO vehicles_migrated (id, plate_number, entry_time, exit_time) "
+                     "SELECT id, plate_number, entry_time, exit_time FROM vehicles")
+        conn.execute("DROP TABLE vehicles")
+        conn.execute("ALTER TABLE vehicles_migrated RENAME TO vehicles")
+
+    # Old inserts picked ids by hand; make sure the sequence is past all of them.
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vehicles").fetchone()[0]
+    updated = conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'vehicles'", (max_id,))
+    if updated.rowcount == 0 and max_id:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('vehicles', ?)", (max_id,))
+
+def _migrate_vehicle_indexes(conn):
+    # NOCASE so a prefix search, case-insensitive like LIKE, can walk it.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicles_plate ON vehicles (plate_number COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicles_entry_time ON vehicles (entry_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicles_plate_exit ON vehicles (plate_number, exit_time)")
+
+def _migrate_open_sessions_index(conn):
+    # Partial index over the sessions that have not exited yet; it stays as
+    # small as the car park however long the history grows.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicles_open ON vehicles (plate_number, entry_time) "
+                 "WHERE exit_time IS NULL")
+
+def _migrate_rollup_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS daily_rollup
+                    (day TEXT PRIMARY KEY,
+                    entries INTEGER NOT NULL DEFAULT 0,
+                    exits INTEGER NOT NULL DEFAULT 0,
+                    stays INTEGER NOT NULL DEFAULT 0,
+                    stay_seconds INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS hourly_rollup
+                    (day TEXT,
+                    hour INTEGER,
+                    entries INTEGER NOT NULL DEFAULT 0,
+                    exits INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, hour))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS stay_histogram
+                    (day TEXT,
+                    bucket INTEGER,
+                    stays INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, bucket))''')
+    _fill_rollups(conn)
+
+def _migrate_user_roles(conn):
+    # Admins see the Performance page. Nobody is one until granted with
+    # "python parking_db.py grant-admin USERNAME".
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    if "is_admin" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN is_admin INTEGER NOT NULL DEFAULT 0")
+
+def _migrate_plate_keys(conn):
+    # Normalized plate keys (see plate_match.plate_key) for exit matching,
+    # indexed for the sessions still open only.
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(vehicles)")]
+    if "plate_key" not in columns:
+        conn.execute("ALTER TABLE vehicles ADD COLUMN plate_key TEXT")
+    conn.create_function("plate_key", 1, plate_match.plate_key, deterministic=True)
+    conn.execute("UPDATE vehicles SET plate_key = plate_key(plate_number)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicles_open_key ON vehicles (plate_key) "
+                 "WHERE exit_time IS NULL")
+
+def _migrate_occupancy(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS occupancy
+                    (id INTEGER PRIMARY KEY CHECK (id = 1),
+                    parked INTEGER NOT NULL,
+                    updated_at TEXT)''')
+    _fill_occupancy(conn)
+    # Open sessions by entry time, for the longest-staying cars.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicles_open_entry ON vehicles (entry_time) "
+                 "WHERE exit_time IS NULL")
+
+def _migrate_drop_plate_exit_index(conn):
+    # Open sessions are found through idx_vehicles_open; a full index on
+    # (plate_number, exit_time) only cost every insert and exit its upkeep.
+    conn.execute("DROP INDEX IF EXISTS idx_vehicles_plate_exit")
+
+# Schema changes applied in order; PRAGMA user_version records how many of
+# them a database file has already been through.
+migrations = [
+    _migrate_autoincrement_ids,
+    _migrate_vehicle_indexes,
+    _migrate_open_sessions_index,
+    _migrate_rollup_tables,
+    _migrate_user_roles,
+    _migrate_plate_keys,
+    _migrate_occupancy,
+    _migrate_drop_plate_exit_index,
+]
+
+def _schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    for target, step in enumerate(migrations, start=1):
+        if _schema_version(conn) >= target:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have run this step while we waited for the lock.
+            if _schema_version(conn) < target:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance commands for the parking database.")
+    parser.add_argument("--db", default=db_path, help="database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild-rollups", help="recompute the report rollup tables from all vehicle records")
+    import_parser = commands.add_parser("import", help="bulk load vehicle records from a CSV file")
+    import_parser.add_argument("file", help="CSV with plate number, entry time and exit time columns")
+    import_parser.add_argument("--batch-size", type=int, default=50000, help="rows per transaction")
+    archive = commands.add_parser("archive", help="move old closed sessions into monthly archive tables")
+    archive.add_argument("--months", type=int, required=True,
+                         help="keep this many whole months (plus the current one) in the live table")
+    grant = commands.add_parser("grant-admin", help="let a user see the admin pages")
+    grant.add_argument("username")
+    grant.add_argument("--revoke", action="store_true", help="take admin rights away instead")
+    args = parser.parse_args()
+
+    configure(args.db)
+    if args.command == "rebuild-rollups":
+        print(f"Rollups rebuilt for {rebuild_rollups()} days.")
+    elif args.command == "import":
+        imported, skipped = import_vehicle_records(args.file, args.batch_size)
+        print(f"Imported {imported} records.")
+        if skipped:
+            print(f"Skipped {skipped} rows without a plate or with times not in {time_format!r} format.")
+    elif args.command == "archive":
+        moved = archive_vehicle_records(args.months)
+        for month, count in moved.items():
+            print(f"{month}: {count} records archived")
+        print(f"Archived {sum(moved.values())} records.")
+    elif args.command == "grant-admin":
+        if not set_admin(args.username, not args.revoke):
+            parser.exit(1, f"No user named {args.username!r}.\n")
+        print(f"{args.username} is {'no longer' if args.revoke else 'now'} an admin.")
+
+if __name__ == "__main__":
+    main()
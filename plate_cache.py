@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Recognition results keyed by a hash of the uploaded image bytes. Streamlit
+# reruns the whole script on every widget interaction, so the same uploads
+# come through again and again; a hit skips decoding and OCR entirely.
+# A small in-memory LRU sits in front of a size-bounded SQLite file so the
+# results also survive server restarts.
+cache_path = os.environ.get("PLATE_CACHE_PATH", "plate_cache.db")
+max_entries = int(os.environ.get("PLATE_CACHE_ENTRIES", 20000))
+memory_entries = 512
+
+
+def image_key(image, salt=""):
+    # salt carries the detector settings, so changing them misses the cache.
+    digest = hashlib.sha256(salt.encode())
+    digest.update(memoryview(image).cast("B"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path=None, max_entries=max_entries, memory_entries=memory_entries):
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS plate_results
+                                 (key TEXT PRIMARY KEY,
+                                 result TEXT,
+                                 last_used REAL)''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_plate_results_last_used ON plate_results (last_used)")
+            self.conn.commit()
+
+    def _remember(self, key, result):
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            result = self.memory.get(key)
+            if result is not None:
+                self.memory.move_to_end(key)
+            elif self.conn is not None:
+                row = self.conn.execute("SELECT result FROM plate_results WHERE key=?", (key,)).fetchone()
+                if row:
+                    result = json.loads(row[0])
+                    self.conn.execute("UPDATE plate_results SET last_used=? WHERE key=?", (time.time(), key))
+                    self.conn.commit()
+                    self._remember(key, result)
+
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(result)
+
+    def put(self, key, result):
+        with self.lock:
+            self._remember(key, result)
+            if self.conn is None:
+                return
+            self.conn.execute("INSERT OR REPLACE INTO plate_results (key, result, last_used) VALUES (?, ?, ?)",
+                              (key, json.dumps(result), time.time()))
+            count = self.conn.execute("SELECT COUNT(*) FROM plate_results").fetchone()[0]
+            if count > self.max_entries:
+                # Evict a tenth at a time so eviction is not paid on every put.
+                excess = count - self.max_entries + self.max_entries // 10
+                self.conn.execute("DELETE FROM plate_results WHERE key IN "
+                                  "(SELECT key FROM plate_results ORDER BY last_used ASC LIMIT ?)", (excess,))
+                self.evictions += excess
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = len(self.memory)
+            if self.conn is not None:
+                entries = self.conn.execute("SELECT COUNT(*) FROM plate_results").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": entries}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(cache_path)
+    return _cache
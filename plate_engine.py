@@ -0,0 +1,474 @@
+import os
+import re
+import time
+import struct
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+import metrics
+import plate_cache
+
+languages = ['en']
+
+min_contour_area = 500
+
+# Candidate plate regions are searched for on a copy of the image no wider
+# than this, scored, and only the best few are handed to the OCR model.
+detection_max_width = 1280
+candidate_count = int(os.environ.get("PLATE_CANDIDATES", 3))
+plate_aspect_range = (1.5, 7.0)
+plate_aspect_ideal = 3.5
+plate_edge_density = 0.15
+
+# Encoded uploads are decoded for detection at 1/2, 1/4 or 1/8 size straight
+# from the JPEG (IMREAD_REDUCED_GRAYSCALE_*), as long as the result is still
+# at least detection_max_width wide; only the candidate regions are then
+# cut from a full resolution grayscale decode for OCR.
+_reduced_decode_flags = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+# A candidate whose text matches this is taken without OCRing the rest.
+# The default accepts Malaysian style plates such as "WLT 1300" or "ALQ993".
+plate_pattern = re.compile(os.environ.get("PLATE_PATTERN", r"^[A-Z]{1,3} ?\d{1,4} ?[A-Z]{0,2}$"))
+
+# One easyocr.Reader per process, built the first time a plate is read.
+# Importing easyocr pulls in torch and loading the model takes seconds, so
+# neither happens at import time. Pool workers each warm up their own.
+_reader = None
+_reader_lock = threading.Lock()
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def default_workers():
+    workers = os.environ.get("PLATE_OCR_WORKERS")
+    if workers:
+        return max(1, int(workers))
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def get_reader():
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                import easyocr
+                _reader = easyocr.Reader(languages, gpu=False)
+    return _reader
+
+
+def _binarize(gray):
+    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    thresh = cv2.bitwise_not(thresh)
+    kernel = np.ones((3, 3), np.uint8)
+    return blur, cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+
+
+def find_plate_region(img):
+    # The original detector, the largest contour in the whole frame; kept as
+    # the baseline for benchmarks/detector.py.
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, masked = _binarize(gray)
+
+    contours, _ = cv2.findContours(masked, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    largest_area = 0
+    largest_contour = None
+
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area > min_contour_area and area > largest_area:
+            largest_area = area
+            largest_contour = contour
+
+    if largest_contour is None:
+        return gray, None
+    return gray, cv2.boundingRect(largest_contour)
+
+
+def find_plate_candidates(gray, top_k=None, timings=None):
+    # Returns up to top_k (box, score) pairs, best first, with boxes in the
+    # coordinates of gray. When a timings dict is given, the seconds spent in
+    # each step are added to it. Each contour is scored on how plate-like it is:
+    # rectangularity (contour area over its rotated bounding box), aspect
+    # ratio close to a plate's, and edge density from the characters.
+    # Contours with an impossible size or aspect ratio are dropped before
+    # the more expensive measurements. A frame that itself has a plate's
+    # aspect ratio may be a close-up of just the plate, with no outline to
+    # find, so the whole frame is scored as one more candidate.
+    top_k = top_k or candidate_count
+    timings = {} if timings is None else timings
+    mark = time.perf_counter()
+    height, width = gray.shape[:2]
+    scale = min(1.0, detection_max_width / width)
+    if scale < 1.0:
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        small = gray
+    blur, masked = _binarize(small)
+    timings['binarize'] = time.perf_counter() - mark
+    mark = time.perf_counter()
+    edges = cv2.Canny(blur, 100, 200)
+    timings['edges'] = time.perf_counter() - mark
+
+    small_area = small.shape[0] * small.shape[1]
+    min_area = min_contour_area * scale * scale
+    # RETR_LIST rather than RETR_EXTERNAL: the plate usually sits inside the
+    # outline of the car body and would be hidden by it otherwise.
+    mark = time.perf_counter()
+    contours, _ = cv2.findContours(masked, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    timings['contours'] = time.perf_counter() - mark
+    mark = time.perf_counter()
+    candidates = []
+
+    def add_candidate(box, rectangularity):
+        x, y, w, h = box
+        aspect = w / h
+        aspect_score = 1.0 - min(abs(aspect - plate_aspect_ideal) / plate_aspect_ideal, 1.0)
+        edge_density = cv2.countNonZero(edges[y:y + h, x:x + w]) / float(w * h)
+        edge_score = min(edge_density / plate_edge_density, 1.0)
+
+        score = rectangularity * (0.5 + 0.5 * aspect_score) * edge_score
+        if score > 0:
+            candidates.append((score, box))
+
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < min_area or w * h > small_area / 4:
+            continue
+        if not plate_aspect_range[0] <= w / h <= plate_aspect_range[1]:
+            continue
+
+        (_, _), (rect_w, rect_h), _ = cv2.minAreaRect(contour)
+        add_candidate((x, y, w, h), cv2.contourArea(contour) / max(rect_w * rect_h, 1.0))
+    if plate_aspect_range[0] <= width / height <= plate_aspect_range[1]:
+        add_candidate((0, 0, small.shape[1], small.shape[0]), 1.0)
+
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    results = []
+    for score, (x, y, w, h) in candidates[:top_k]:
+        box = (int(x / scale), int(y / scale), int(w / scale), int(h / scale)) if scale < 1.0 else (x, y, w, h)
+        results.append((box, score))
+    timings['scoring'] = time.perf_counter() - mark
+    return results
+
+
+def read_plate(reader, plate_img):
+    # Returns (text, confidence): the alphanumerics of every detection joined
+    # with spaces, and the mean easyocr confidence of those detections.
+    result = reader.readtext(plate_img)
+
+    alphanumeric_text = ''
+    confidences = []
+    for detection in result:
+        text = detection[1]
+        alphanumeric_text += ''.join(filter(str.isalnum, text)) + ' '
+        confidences.append(float(detection[2]))
+
+    confidence = sum(confidences) / len(confidences) if confidences else None
+    return alphanumeric_text.strip(), confidence
+
+
+def read_plate_text(reader, plate_img):
+    return read_plate(reader, plate_img)[0]
+
+
+def _read_candidates(reader, crops, pattern, result, timings):
+    # crops: (box, plate image) pairs, best candidate first.
+    mark = time.perf_counter()
+    for (x, y, w, h), plate_img in crops:
+        read_start = time.perf_counter()
+        text, confidence = read_plate(reader, plate_img)
+        timings['readtext'] = timings.get('readtext', 0.0) + time.perf_counter() - read_start
+        if not text:
+            continue
+        matched = pattern.match(text)
+        if matched or result["plate_number"] is None:
+            result.update(plate_number=text, box=[x, y, w, h], confidence=confidence)
+        if matched:
+            break
+    if crops:
+        timings['ocr'] = time.perf_counter() - mark
+
+
+def recognize_frame(img, reader, top_k=None, pattern=None):
+    # Recognize an already decoded BGR frame, e.g. one read from a camera.
+    # Returns a dict with the plate number (or None), the box it was read
+    # from, the OCR confidence and the seconds spent per stage.
+    # Candidates are read best first; the first text matching the plate
+    # pattern wins, otherwise the first non-empty text is returned.
+    pattern = pattern or plate_pattern
+    timings = {}
+    start = time.perf_counter()
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    timings['grayscale'] = time.perf_counter() - start
+    boxes = [box for box, _ in find_plate_candidates(gray, top_k, timings)]
+    timings['detect'] = time.perf_counter() - start
+
+    result = {"plate_number": None, "box": None, "confidence": None, "timings": timings}
+    _read_candidates(reader, [((x, y, w, h), gray[y:y + h, x:x + w]) for x, y, w, h in boxes],
+                     pattern, result, timings)
+    timings['total'] = time.perf_counter() - start
+    return result
+
+
+def image_size(data):
+    # (width, height) read from a PNG or JPEG header without decoding
+    # anything, or None for other or damaged files.
+    view = memoryview(data).cast("B")
+    if bytes(view[:8]) == b"\x89PNG\r\n\x1a\n" and len(view) >= 24:
+        return struct.unpack(">II", view[16:24])
+    if bytes(view[:2]) != b"\xff\xd8":
+        return None
+    index = 2
+    while index + 9 < len(view):
+        if view[index] != 0xFF:
+            return None
+        marker = view[index + 1]
+        if marker == 0xFF or marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Fill byte or a marker without a length.
+            index += 1 if marker == 0xFF else 2
+            continue
+        # Start of frame markers carry the size; C4, C8 and CC are not frames.
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", view[index + 5:index + 9])
+            return width, height
+        index += 2 + struct.unpack(">H", view[index + 2:index + 4])[0]
+    return None
+
+
+def reduced_decode_factor(data):
+    # The largest of 1, 2, 4, 8 that keeps the decoded width at or above
+    # detection_max_width.
+    size = image_size(data)
+    if size is None:
+        return 1
+    factor = 1
+    while factor < 8 and size[0] // (factor * 2) >= detection_max_width:
+        factor *= 2
+    return factor
+
+
+def recognize(image, reader, top_k=None, pattern=None):
+    # Same as recognize_frame but for an encoded (jpg/png) image buffer:
+    # bytes, a memoryview such as UploadedFile.getbuffer() or a uint8 array,
+    # read in place without copying. Peak memory is a reduced grayscale
+    # image for detection plus, when it was reduced, one full resolution
+    # grayscale decode that is dropped as soon as the candidates are cut out.
+    pattern = pattern or plate_pattern
+    timings = {}
+    result = {"plate_number": None, "box": None, "confidence": None, "timings": timings}
+    start = time.perf_counter()
+
+    buffer = np.frombuffer(image, dtype=np.uint8)
+    # imdecode raises on an empty buffer instead of returning None.
+    factor = reduced_decode_factor(buffer) if buffer.size else 1
+    gray = cv2.imdecode(buffer, _reduced_decode_flags[factor]) if buffer.size else None
+    timings['decode'] = time.perf_counter() - start
+    if gray is None:
+        timings['total'] = timings['decode']
+        return result
+
+    mark = time.perf_counter()
+    candidates = find_plate_candidates(gray, top_k, timings)
+    timings['detect'] = time.perf_counter() - mark
+
+    if factor == 1:
+        crops = [((x, y, w, h), gray[y:y + h, x:x + w]) for (x, y, w, h), _ in candidates]
+    elif candidates:
+        mark = time.perf_counter()
+        del gray
+        full = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+        height, width = full.shape[:2]
+        crops = []
+        for (x, y, w, h), _ in candidates:
+            # Widen by a reduced pixel on each side to cover the rounding.
+            x0, y0 = max(0, (x - 1) * factor), max(0, (y - 1) * factor)
+            x1, y1 = min(width, (x + w + 1) * factor), min(height, (y + h + 1) * factor)
+            crops.append(((x0, y0, x1 - x0, y1 - y0), full[y0:y1, x0:x1].copy()))
+        del full
+        timings['crop'] = time.perf_counter() - mark
+    else:
+        crops = []
+
+    _read_candidates(reader, crops, pattern, result, timings)
+    timings['total'] = time.perf_counter() - start
+    return result
+
+
+def record_metrics(result):
+    # Feed a result's stage timings to the metrics registry. Called in the
+    # process that asked for the recognition, so timings measured in pool
+    # workers are recorded too.
+    if result.get("error"):
+        metrics.increment("ocr.errors")
+        return
+    if result.get("cached"):
+        metrics.increment("ocr.cache_hits")
+    else:
+        metrics.increment("ocr.images")
+        metrics.observe_timings("ocr", result["timings"])
+    if not result["plate_number"]:
+        metrics.increment("ocr.no_plate")
+
+
+def _cache_salt():
+    return f"{candidate_count}|{detection_max_width}|{plate_pattern.pattern}"
+
+
+def _cached(key):
+    result = plate_cache.get_cache().get(key)
+    if result is not None:
+        result["cached"] = True
+        result["timings"] = {'total': 0.0}
+    return result
+
+
+def _store(key, result):
+    plate_cache.get_cache().put(key, {"plate_number": result["plate_number"], "box": result["box"],
+                                      "confidence": result["confidence"]})
+
+
+def recognize_cached(image, reader):
+    # recognize(), but an image whose bytes were seen before is answered
+    # from the result cache without being decoded.
+    key = plate_cache.image_key(image, _cache_salt())
+    result = _cached(key)
+    if result is None:
+        result = recognize(image, reader)
+        _store(key, result)
+    record_metrics(result)
+    return result
+
+
+def process_image(image, reader):
+    return recognize_cached(image, reader)["plate_number"]
+
+
+def _init_worker():
+    # Several workers share the machine, so keep each one single-threaded
+    # instead of letting OpenCV and torch oversubscribe every core.
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    get_reader()
+
+
+def _recognize_in_worker(data):
+    return recognize(data, get_reader())
+
+
+def get_pool(workers=None):
+    global _pool, _pool_workers
+    workers = workers or default_workers()
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # spawn rather than fork: the parent may already hold torch and
+            # Streamlit threads, which do not survive a fork safely.
+            _pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker)
+            _pool_workers = workers
+        return _pool
+
+
+def _forget_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            _pool_workers = 0
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+            _pool_workers = 0
+
+
+atexit.register(shutdown_pool)
+
+
+def _failed(error):
+    # The result for an image whose recognition raised; not cached.
+    return {"plate_number": None, "box": None, "confidence": None, "timings": {}, "error": str(error)}
+
+
+def _outcome(future):
+    try:
+        return future.result()
+    except BrokenProcessPool as e:
+        # A worker died; every image still in the pool fails with it, and
+        # the next batch gets a fresh pool.
+        _forget_pool()
+        return _failed(e)
+    except Exception as e:
+        return _failed(e)
+
+
+def recognize_batch(images, reader=None, workers=None):
+    # Recognize many encoded images at once. Results come back in input order
+    # as dicts like recognize() returns. Images already in the result cache
+    # are answered from it; only the rest are sent to OCR. An image whose
+    # recognition raises gets a result without a plate and with the
+    # exception's message under "error"; the others are unaffected.
+    salt = _cache_salt()
+    keys = [plate_cache.image_key(image, salt) for image in images]
+    results = [_cached(key) for key in keys]
+    missing = [index for index, result in enumerate(results) if result is None]
+    if not missing:
+        for result in results:
+            record_metrics(result)
+        return results
+
+    workers = workers or default_workers()
+
+    # A single image is not worth the round trip to a worker process when the
+    # caller already has a warm reader of its own.
+    if reader is not None and (len(missing) == 1 or workers == 1):
+        outcomes = []
+        for index in missing:
+            try:
+                outcomes.append(recognize(images[index], reader))
+            except Exception as e:
+                outcomes.append(_failed(e))
+    else:
+        # Worker processes need their own copy of the bytes.
+        pool = get_pool(workers)
+        futures = [pool.submit(_recognize_in_worker, bytes(images[index])) for index in missing]
+        outcomes = [_outcome(future) for future in futures]
+
+    for index, result in zip(missing, outcomes):
+        if not result.get("error"):
+            _store(keys[index], result)
+        results[index] = result
+    for result in results:
+        record_metrics(result)
+    return results
+
+
+def cache_stats():
+    return plate_cache.get_cache().stats()
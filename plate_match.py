@@ -0,0 +1,169 @@
+import os
+import threading
+
+# OCR reads the same plate differently from one photo to the next: spacing
+# changes ("ABC 1234" / "ABC1234") and look-alike characters swap (O/0,
+# I/1, ...). plate_key() folds those differences away so the entry and the
+# exit of one car agree; PlateIndex then finds the closest key among the
+# open sessions when an exit read still differs by a character or so.
+
+# Characters OCR confuses outright, folded to one representative.
+_folds = str.maketrans({"O": "0", "Q": "0", "I": "1", "L": "1", "Z": "2", "S": "5", "B": "8", "G": "6"})
+
+# Pairs that are often, but not always, confused: substituting one for the
+# other costs this much instead of a full edit.
+similar_cost = 0.5
+_similar = {frozenset(pair) for pair in ("D0", "U0", "A4", "71", "E3", "T7", "MN", "UV", "EF", "HM")}
+
+# Any other substitution costs as much as deleting the character and
+# inserting the other. With the default max_distance, a read may differ by
+# look-alike characters and one missing or extra character, but never by a
+# different character: WXY1235 is another car than WXY1234.
+substitution_cost = 2.0
+max_distance = float(os.environ.get("PLATE_MATCH_DISTANCE", 1.0))
+
+# Shorter keys are not matched approximately: one edit away from a short
+# plate is too likely to be another car.
+min_fuzzy_length = 5
+
+
+def normalize_plate(text):
+    return ''.join(filter(str.isalnum, text or '')).upper()
+
+
+def plate_key(text):
+    # None for text without any letters or digits.
+    return normalize_plate(text).translate(_folds) or None
+
+
+def _substitution_cost(a, b):
+    if a == b:
+        return 0.0
+    return similar_cost if frozenset((a, b)) in _similar else substitution_cost
+
+
+def _look_alike_classes(pairs):
+    # Maps every character of the similar pairs to one representative of
+    # its group of (transitively) look-alike characters.
+    groups = {}
+    for pair in pairs:
+        a, b = sorted(pair)
+        merged = groups.get(a, {a}) | groups.get(b, {b})
+        for char in merged:
+            groups[char] = merged
+    return str.maketrans({char: min(group) for char, group in groups.items()})
+
+
+_classes = _look_alike_classes(_similar)
+
+
+def distance(a, b, limit=None):
+    # Weighted Levenshtein distance between two keys. With a limit, gives up
+    # early and returns something above it once every path costs more, and
+    # only fills the cells within int(limit) of the diagonal: the others
+    # take more insertions and deletions than that.
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    band = len(a) + len(b) if limit is None else int(limit)
+    inf = float("inf")
+    previous = [float(j) if j <= band else inf for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, start=1):
+        current = [float(i) if i <= band else inf] + [inf] * len(b)
+        for j in range(max(1, i - band), min(len(b), i + band) + 1):
+            char_b = b[j - 1]
+            current[j] = min(previous[j] + 1,
+                             current[j - 1] + 1,
+                             previous[j - 1] + (0.0 if char_a == char_b else _substitution_cost(char_a, char_b)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _deletions(key, depth):
+    # {text: fewest characters deleted to get it} for every text obtained
+    # by deleting up to depth characters of the key, look-alike characters
+    # merged first.
+    found = {key.translate(_classes): 0}
+    frontier = set(found)
+    for deleted in range(1, depth + 1):
+        frontier = {text[:i] + text[i + 1:] for text in frontier for i in range(len(text))} - found.keys()
+        found.update(dict.fromkeys(frontier, deleted))
+    return found
+
+
+class PlateIndex:
+    # Keys of the open sessions, indexed by their deletion variants. Apart
+    # from look-alike substitutions, which the variants ignore, every edit
+    # is one deleted character on one side (an insertion or deletion,
+    # cost 1) or on each side (any other substitution, substitution_cost).
+    # So a key within limit of a read turns into the same text as the read
+    # by deleting at most depth characters from the two together. A
+    # lookup lists the read's variants and only computes distances for the
+    # keys meeting it that way: a few hash lookups and a handful of
+    # candidates however many cars are parked and however alike their
+    # plates are.
+    def __init__(self, keys=(), limit=None):
+        self.limit = max_distance if limit is None else limit
+        self.depth = int(self.limit / min(1.0, substitution_cost / 2))
+        self.counts = {}
+        self.variants = {}
+        self.lock = threading.Lock()
+        for key in keys:
+            self.add(key)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key):
+        if not key:
+            return
+        with self.lock:
+            if key not in self.counts:
+                for text, deleted in _deletions(key, self.depth).items():
+                    self.variants.setdefault(text, {})[key] = deleted
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def remove(self, key):
+        with self.lock:
+            count = self.counts.get(key)
+            if count is None:
+                return
+            if count > 1:
+                self.counts[key] = count - 1
+                return
+            del self.counts[key]
+            for text in _deletions(key, self.depth):
+                keys = self.variants.get(text)
+                if keys is not None:
+                    keys.pop(key, None)
+                    if not keys:
+                        del self.variants[text]
+
+    def best_match(self, key):
+        # The indexed key closest to key within the limit, or None when
+        # there is none or when two keys are equally close (better no match
+        # than closing another car's session).
+        if not key:
+            return None
+        query = _deletions(key, self.depth)
+        with self.lock:
+            if key in self.counts:
+                return key
+            if len(key) < min_fuzzy_length:
+                return None
+            candidates = {candidate
+                          for text, deleted in query.items()
+                          for candidate, candidate_deleted in self.variants.get(text, {}).items()
+                          if deleted + candidate_deleted <= self.depth}
+
+        best, best_distance, tied = None, self.limit + 1, False
+        for candidate in candidates:
+            found = distance(key, candidate, self.limit)
+            if found < best_distance:
+                best, best_distance, tied = candidate, found, False
+            elif found == best_distance:
+                tied = True
+        if best is None or best_distance > self.limit or tied:
+            return None
+        return best
@@ -0,0 +1,69 @@
+import pandas as pd
+
+import parking_db
+from parking_db import time_format
+
+# Vehicle records as pandas frames: timestamps are parsed by read_sql in one
+# vectorized pass and durations computed and formatted column-wise, instead
+# of strptime and calculate_duration for every row. Values that are not in
+# time_format become NaT and show as "N/A".
+record_columns = ["id", "plate_number", "entry_time", "exit_time"]
+
+_parse_dates = {column: {"format": time_format, "errors": "coerce"} for column in ("entry_time", "exit_time")}
+
+
+def format_durations(seconds):
+    # calculate_duration() for a whole Series of seconds; NaN gives "N/A".
+    missing = seconds.isna()
+    seconds = seconds.fillna(0).astype("int64")
+    text = ((seconds // 86400).astype(str) + " days, "
+            + (seconds % 86400 // 3600).astype(str) + " hours, "
+            + (seconds % 3600 // 60).astype(str) + " minutes")
+    return text.mask(missing, "N/A")
+
+
+def add_durations(frame, now=None):
+    # Adds duration_seconds and duration. Open sessions run until now when
+    # given, and are "N/A" otherwise.
+    exit_time = frame["exit_time"]
+    if now is not None:
+        exit_time = exit_time.fillna(pd.Timestamp(now))
+    frame["duration_seconds"] = (exit_time - frame["entry_time"]).dt.total_seconds()
+    frame["duration"] = format_durations(frame["duration_seconds"])
+    return frame
+
+
+def _empty_frame():
+    frame = pd.DataFrame({column: pd.Series(dtype="object") for column in record_columns})
+    for column in _parse_dates:
+        frame[column] = pd.to_datetime(frame[column])
+    return frame
+
+
+def search_records_frame(plate=None, plate_match='prefix', time_from=None, time_to=None,
+                         after=None, limit=50):
+    # search_vehicle_records() as a frame with parsed times and durations.
+    with parking_db.connection() as conn:
+        query, params = parking_db.search_statement(conn, plate, plate_match, time_from, time_to,
+                                                    after, limit)
+        frame = pd.read_sql_query(query, conn, params=params, parse_dates=_parse_dates)
+    if frame.empty:
+        frame = _empty_frame()
+    return add_durations(frame)
+
+
+def page_cursor(frame):
+    # The `after` record for the page following frame, with the entry time
+    # back in its stored text form.
+    last = frame.iloc[-1]
+    entry_time = None if pd.isna(last["entry_time"]) else last["entry_time"].strftime(time_format)
+    return int(last["id"]), last["plate_number"], entry_time
+
+
+def records_frame(records, now=None):
+    # A chunk of (id, plate, entry, exit) rows, e.g. from
+    # iter_vehicle_records_between(), as a frame with durations.
+    frame = pd.DataFrame.from_records(records, columns=record_columns)
+    for column, options in _parse_dates.items():
+        frame[column] = pd.to_datetime(frame[column], **options)
+    return add_durations(frame, now)
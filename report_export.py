@@ -0,0 +1,114 @@
+import os
+import csv
+import time
+import datetime
+import tempfile
+
+import record_frames
+from parking_db import iter_vehicle_records_between, time_format
+
+export_columns = ["ID", "Plate Number", "Entry Time", "Exit Time", "Duration"]
+
+export_formats = {
+    "CSV": {"extension": "csv", "mime": "text/csv"},
+    "Parquet": {"extension": "parquet", "mime": "application/vnd.apache.parquet"},
+    "Arrow": {"extension": "arrow", "mime": "application/vnd.apache.arrow.file"},
+}
+
+export_dir = os.path.join(tempfile.gettempdir(), "stationnement_exports")
+
+# Exported files are only needed until the browser has downloaded them.
+export_max_age = 3600
+
+
+def _export_frames(chunks, now):
+    # Each chunk as a frame of the export columns, parsed and formatted
+    # column-wise through pandas; times not in the expected format are NaT.
+    for records in chunks:
+        frame = record_frames.records_frame(records, now)
+        frame = frame[["id", "plate_number", "entry_time", "exit_time", "duration"]]
+        frame.columns = export_columns
+        yield frame
+
+
+def write_csv(path, chunks, now):
+    with open(path, "w", newline="") as export_file:
+        csv.writer(export_file).writerow(export_columns)
+        for frame in _export_frames(chunks, now):
+            frame.to_csv(export_file, header=False, index=False, date_format=time_format, na_rep="N/A",
+                         lineterminator="\r\n")
+
+
+def _arrow_batches(chunks, now):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("Parquet and Arrow exports need the pyarrow package (pip install pyarrow).")
+
+    schema = pa.schema([("ID", pa.int64()),
+                        ("Plate Number", pa.string()),
+                        ("Entry Time", pa.timestamp("s")),
+                        ("Exit Time", pa.timestamp("s")),
+                        ("Duration", pa.string())])
+
+    def batches():
+        for frame in _export_frames(chunks, now):
+            yield pa.RecordBatch.from_pandas(frame, schema=schema, preserve_index=False)
+
+    return schema, batches()
+
+
+def write_parquet(path, chunks, now):
+    schema, batches = _arrow_batches(chunks, now)
+    import pyarrow.parquet as pq
+
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+
+
+def write_arrow(path, chunks, now):
+    schema, batches = _arrow_batches(chunks, now)
+    import pyarrow as pa
+
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+
+
+writers = {
+    "CSV": write_csv,
+    "Parquet": write_parquet,
+    "Arrow": write_arrow,
+}
+
+
+def _remove_old_exports():
+    cutoff = time.time() - export_max_age
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def export_vehicle_records(start_time, end_time, file_format, filename, chunk_size=5000):
+    # Streams the records entered between start_time and end_time into a file
+    # under export_dir and returns its path. Memory use depends on
+    # chunk_size, not on how many records the range holds.
+    os.makedirs(export_dir, exist_ok=True)
+    _remove_old_exports()
+
+    handle, path = tempfile.mkstemp(prefix=f"{os.path.splitext(filename)[0]}_",
+                                    suffix=f".{export_formats[file_format]['extension']}",
+                                    dir=export_dir)
+    os.close(handle)
+    try:
+        writers[file_format](path, iter_vehicle_records_between(start_time, end_time, chunk_size),
+                             datetime.datetime.now())
+    except Exception:
+        os.remove(path)
+        raise
+    return path
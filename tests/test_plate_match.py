@@ -0,0 +1,83 @@
+import unittest
+
+import plate_match
+from plate_match import PlateIndex, distance, plate_key
+
+
+class PlateKeyTest(unittest.TestCase):
+    def test_spacing_and_case_are_ignored(self):
+        self.assertEqual(plate_key("wlt 1300"), "W1T1300")
+        self.assertEqual(plate_key("WLT-1300"), plate_key("W LT1300"))
+
+    def test_confusable_characters_fold_together(self):
+        self.assertEqual(plate_key("WLT 13OO"), plate_key("WLT 1300"))
+        self.assertEqual(plate_key("B5G"), plate_key("856"))
+
+    def test_no_alphanumerics(self):
+        self.assertIsNone(plate_key(" - "))
+        self.assertIsNone(plate_key(None))
+
+
+class DistanceTest(unittest.TestCase):
+    def test_costs(self):
+        self.assertEqual(distance("W1T1300", "W1T1300"), 0)
+        self.assertEqual(distance("D1234", "01234"), plate_match.similar_cost)
+        self.assertEqual(distance("W1T1300", "W1T130"), 1)
+        self.assertEqual(distance("WXY1234", "WXY1235"), plate_match.substitution_cost)
+
+    def test_limit_gives_up_above_it(self):
+        self.assertGreater(distance("WXY1234", "ABC9876", limit=1.0), 1.0)
+        self.assertGreater(distance("WXY1234", "WXY12", limit=1.0), 1.0)
+        self.assertEqual(distance("W1T1300", "W1T130", limit=1.0), 1)
+
+
+class PlateIndexTest(unittest.TestCase):
+    def test_exact_key(self):
+        index = PlateIndex(["W1T1300", "A8C1234"])
+        self.assertEqual(index.best_match("A8C1234"), "A8C1234")
+
+    def test_missing_or_extra_character(self):
+        index = PlateIndex(["W1T1300", "A8C1234"])
+        self.assertEqual(index.best_match("W1T130"), "W1T1300")
+        self.assertEqual(index.best_match("W1T13000"), "W1T1300")
+
+    def test_look_alike_substitutions(self):
+        index = PlateIndex(["D01234", "A8C1234"])
+        self.assertEqual(index.best_match("001234"), "D01234")
+        self.assertEqual(index.best_match("48C1234"), "A8C1234")
+
+    def test_different_character_is_another_car(self):
+        index = PlateIndex(["WXY1234"])
+        self.assertIsNone(index.best_match("WXY1235"))
+        self.assertEqual(PlateIndex(["WXY1234"], limit=2.0).best_match("WXY1235"), "WXY1234")
+
+    def test_ties_are_refused(self):
+        index = PlateIndex(["WXY1234", "WXY1236"])
+        self.assertIsNone(index.best_match("WXY123"))
+
+    def test_closer_key_wins(self):
+        index = PlateIndex(["WXY1234", "WXY0123"])
+        self.assertEqual(index.best_match("WXYD123"), "WXY0123")
+
+    def test_short_keys_only_match_exactly(self):
+        index = PlateIndex(["A8C1", "A8C12"])
+        self.assertEqual(index.best_match("A8C1"), "A8C1")
+        self.assertIsNone(index.best_match("A8C"))
+        self.assertEqual(index.best_match("A8C123"), "A8C12")
+
+    def test_remove_counts_duplicate_keys(self):
+        index = PlateIndex(["W1T1300", "W1T1300"])
+        index.remove("W1T1300")
+        self.assertEqual(index.best_match("W1T130"), "W1T1300")
+        index.remove("W1T1300")
+        self.assertIsNone(index.best_match("W1T130"))
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.variants, {})
+        index.remove("W1T1300")
+
+    def test_empty_key(self):
+        self.assertIsNone(PlateIndex(["W1T1300"]).best_match(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
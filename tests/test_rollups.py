@@ -0,0 +1,162 @@
+import os
+import datetime
+import tempfile
+import unittest
+
+import parking_db
+
+
+class RollupTest(unittest.TestCase):
+    # Every write keeps the rollup tables and the occupancy count in step
+    # with vehicles incrementally; rebuild_rollups() recomputes them from
+    # scratch, so after each write the two must agree.
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.previous_path = parking_db.db_path
+        parking_db.configure(os.path.join(self.workdir.name, "test.db"))
+
+    def tearDown(self):
+        parking_db.configure(self.previous_path)
+        self.workdir.cleanup()
+
+    def rollups(self):
+        # Rows whose counts went back to zero are left behind by the
+        # incremental updates but not written by a rebuild; they mean the
+        # same, so they are left out here.
+        with parking_db.connection() as conn:
+            tables = {table: [row for row in conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2")
+                              if any(row[keys:])]
+                      for table, keys in (("daily_rollup", 1), ("hourly_rollup", 2), ("stay_histogram", 2))}
+            tables["parked"] = conn.execute("SELECT parked FROM occupancy").fetchone()[0]
+        return tables
+
+    def assertConsistent(self):
+        incremental = self.rollups()
+        parking_db.rebuild_rollups()
+        self.assertEqual(incremental, self.rollups())
+        return incremental
+
+    def test_insert_and_exit(self):
+        parking_db.insert_vehicle_record("WLT 1300", "2024-03-01 08:10:00")
+        parking_db.insert_vehicle_record("ABC 123", "2024-03-01 09:00:00")
+        self.assertEqual(self.assertConsistent()["parked"], 2)
+
+        self.assertEqual(parking_db.update_vehicle_record_exit_time("WLT 1300", "2024-03-01 10:40:00"),
+                         "2024-03-01 08:10:00")
+        rollups = self.assertConsistent()
+        self.assertEqual(rollups["parked"], 1)
+        self.assertEqual(rollups["daily_rollup"], [("2024-03-01", 2, 1, 1, 9000)])
+
+        summary = parking_db.get_rollup_summary("2024-03-01", "2024-03-01")
+        self.assertEqual((summary["entries"], summary["exits"], summary["stays"]), (2, 1, 1))
+        self.assertEqual(summary["average_stay_seconds"], 9000)
+        self.assertEqual(summary["median_stay_seconds"], 9450)
+        self.assertEqual(summary["hourly"][-1]["occupancy"], 1)
+
+    def test_stay_percentiles(self):
+        # Stays of 0, 10, 20 and 30 min and one of two days: two in the
+        # first bucket, one in each of the next two and one in the last.
+        for minutes in (0, 10, 20, 30, 2 * 24 * 60):
+            parking_db.insert_vehicle_record(f"WLT {minutes}", "2024-03-01 08:00:00")
+            exit_time = datetime.datetime(2024, 3, 1, 8) + datetime.timedelta(minutes=minutes)
+            parking_db.update_vehicle_record_exit_time(f"WLT {minutes}", exit_time.strftime(parking_db.time_format))
+        self.assertConsistent()
+
+        summary = parking_db.get_rollup_summary("2024-03-01", "2024-03-03")
+        self.assertEqual(summary["median_stay_seconds"], 1350)
+        self.assertEqual(summary["p90_stay_seconds"], 24 * 3600)
+        self.assertEqual(parking_db._stay_percentile([(0, 1)], 1, 0.5), 450)
+
+    def test_exit_without_session(self):
+        self.assertEqual(parking_db.close_open_session("NOT 1", "2024-03-01 10:00:00"), (None, None))
+        self.assertEqual(self.assertConsistent()["parked"], 0)
+
+    def test_exit_matched_by_key_and_fuzzily(self):
+        parking_db.insert_vehicle_record("WLT 1300", "2024-03-01 08:00:00")
+        parking_db.insert_vehicle_record("ABC 4567", "2024-03-01 08:30:00")
+        self.assertEqual(parking_db.close_open_session("WLT13OO", "2024-03-01 09:00:00"),
+                         ("2024-03-01 08:00:00", "WLT 1300"))
+        self.assertEqual(parking_db.close_open_session("ABC 456", "2024-03-01 09:30:00"),
+                         ("2024-03-01 08:30:00", "ABC 4567"))
+        self.assertEqual(self.assertConsistent()["parked"], 0)
+
+    def test_plates_sharing_a_key_are_not_matched(self):
+        # WQA and WOA both fold to W0A: an exit read of either that is not
+        # exact must not close both sessions, nor pick one of them.
+        parking_db.insert_vehicle_record("WQA 1234", "2024-03-01 08:00:00")
+        parking_db.insert_vehicle_record("WOA 1234", "2024-03-01 08:30:00")
+        self.assertEqual(parking_db.close_open_session("WQA1234", "2024-03-01 09:00:00"), (None, None))
+        self.assertEqual(self.assertConsistent()["parked"], 2)
+        self.assertEqual(parking_db.close_open_session("WQA 1234", "2024-03-01 09:00:00"),
+                         ("2024-03-01 08:00:00", "WQA 1234"))
+        self.assertEqual(self.assertConsistent()["parked"], 1)
+
+    def test_different_plate_does_not_close_session(self):
+        parking_db.insert_vehicle_record("WXY 1234", "2024-03-01 08:00:00")
+        self.assertEqual(parking_db.close_open_session("WXY 1235", "2024-03-01 09:00:00"), (None, None))
+        self.assertEqual(self.assertConsistent()["parked"], 1)
+
+    def test_edit(self):
+        record_id = parking_db.insert_vehicle_record("WLT 1300", "2024-03-01 08:00:00")
+        self.assertTrue(parking_db.update_vehicle_record(record_id, "WLT 1300", "2024-03-02 07:00:00",
+                                                         "2024-03-02 09:15:00"))
+        rollups = self.assertConsistent()
+        self.assertEqual(rollups["parked"], 0)
+        self.assertEqual(rollups["daily_rollup"], [("2024-03-02", 1, 1, 1, 8100)])
+
+        self.assertTrue(parking_db.update_vehicle_record(record_id, "WLT 1300", "2024-03-02 07:00:00", ""))
+        self.assertEqual(self.assertConsistent()["parked"], 1)
+        self.assertFalse(parking_db.update_vehicle_record(record_id + 1, "X", "2024-03-02 07:00:00", ""))
+
+    def test_delete(self):
+        open_id = parking_db.insert_vehicle_record("WLT 1300", "2024-03-01 08:00:00")
+        closed_id = parking_db.insert_vehicle_record("ABC 123", "2024-03-01 08:30:00")
+        parking_db.update_vehicle_record_exit_time("ABC 123", "2024-03-01 12:00:00")
+        self.assertTrue(parking_db.delete_vehicle_record(open_id))
+        self.assertTrue(parking_db.delete_vehicle_record(closed_id))
+        self.assertFalse(parking_db.delete_vehicle_record(closed_id))
+        rollups = self.assertConsistent()
+        self.assertEqual(rollups["parked"], 0)
+        self.assertEqual((rollups["daily_rollup"], rollups["stay_histogram"]), ([], []))
+
+    def test_unparseable_times_still_count_as_parked(self):
+        record_id = parking_db.insert_vehicle_record("WLT 1300", "yesterday")
+        rollups = self.assertConsistent()
+        self.assertEqual((rollups["parked"], rollups["daily_rollup"]), (1, []))
+        parking_db.delete_vehicle_record(record_id)
+        self.assertEqual(self.assertConsistent()["parked"], 0)
+
+    def test_archive_keeps_rollups(self):
+        for day in range(1, 4):
+            parking_db.insert_vehicle_record(f"OLD {day}", f"2024-01-0{day} 08:00:00")
+            parking_db.update_vehicle_record_exit_time(f"OLD {day}", f"2024-01-0{day} 18:00:00")
+        parking_db.insert_vehicle_record("NEW 1", "2024-06-01 08:00:00")
+        before = self.assertConsistent()
+
+        self.assertEqual(parking_db.archive_vehicle_records(3, today=datetime.date(2024, 6, 15)), {"2024-01": 3})
+        self.assertEqual(self.assertConsistent(), before)
+        self.assertEqual(len(parking_db.search_vehicle_records(time_from="2024-01-01 00:00:00",
+                                                               time_to="2024-01-31 23:59:59")), 3)
+
+    def test_import(self):
+        parking_db.insert_vehicle_record("LIVE 1", "2024-03-01 07:00:00")
+        path = os.path.join(self.workdir.name, "import.csv")
+        open(path, "w").close()
+        self.assertEqual(parking_db.import_vehicle_records(path), (0, 0))
+
+        with open(path, "w", newline="") as import_file:
+            import_file.write("ID,Plate Number,Entry Time,Exit Time,Duration\r\n"
+                              "1,WLT 1300,2024-03-01 08:00:00,2024-03-01 09:00:00,x\r\n"
+                              "2,ABC 123,2024-03-02 10:00:00,N/A,x\r\n"
+                              "3,BAD 1,yesterday,N/A,x\r\n"
+                              "4,BAD 2,2024-03-02 10:00:00,soon,x\r\n"
+                              "5,,2024-03-02 10:00:00,,x\r\n")
+        self.assertEqual(parking_db.import_vehicle_records(path, batch_size=1), (2, 3))
+        rollups = self.assertConsistent()
+        self.assertEqual(rollups["parked"], 2)
+        self.assertEqual(rollups["daily_rollup"], [("2024-03-01", 2, 1, 1, 3600), ("2024-03-02", 1, 0, 0, 0)])
+        self.assertEqual(parking_db.close_open_session("ABC 123", "2024-03-02 11:00:00")[0], "2024-03-02 10:00:00")
+
+
+if __name__ == "__main__":
+    unittest.main()